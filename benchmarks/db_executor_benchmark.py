@@ -0,0 +1,71 @@
+"""Concurrent-request throughput of async handlers, before and after moving
+boto3 calls onto the DynamoDB executor.
+
+The table is a stand-in whose put_item sleeps for --latency seconds, which
+is what a blocking boto3 round trip looks like to the event loop.
+
+    python benchmarks/db_executor_benchmark.py --requests 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "enrollment-service"))
+from dynamo import run_db, DB_EXECUTOR_WORKERS
+
+class SlowTable:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def put_item(self, Item):
+        time.sleep(self.latency)
+        return {}
+
+def build_app(table, offloaded):
+    app = FastAPI()
+
+    @app.post("/enrollments/enroll")
+    async def enroll():
+        item = {"enrollment_id": "e1", "status": "pending_payment"}
+        if offloaded:
+            await run_db(table, "put_item", Item=item)
+        else:
+            table.put_item(Item=item)
+        return item
+
+    return app
+
+async def drive(app, requests, concurrency):
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                response = await client.post("/enrollments/enroll")
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    table = SlowTable(args.latency)
+    print(f"requests={args.requests} concurrency={args.concurrency} "
+          f"latency={args.latency * 1000:.0f}ms executor_workers={DB_EXECUTOR_WORKERS}")
+    for label, offloaded in (("before (inline boto3)", False), ("after (run_db executor)", True)):
+        elapsed = asyncio.run(drive(build_app(table, offloaded), args.requests, args.concurrency))
+        print(f"{label:<26} {args.requests / elapsed:8.1f} req/s  ({elapsed:.2f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""End-to-end load test through the gateway, against a local stack.
+
+Boots the five services and the gateway (see local_stack.py), seeds courses
+and users, then runs closed-loop virtual users for --duration seconds. Each
+iteration picks a scenario from the weighted mix:
+
+    browse             GET /courses/list, then GET /courses/{course_id} twice
+    auth               register a new user, log in, GET /auth/me
+    enroll_pay_notify  enroll, pay (which queues the email), POST /notify/success
+    checkout           POST /checkout saga as a signed-in user
+
+Throughput and p50/p95/p99 latency are reported per route. --save-baseline
+records the results, and later runs compared against that baseline fail
+when a route regresses beyond --tolerance:
+
+    python benchmarks/load_test.py --duration 30 --concurrency 20 --save-baseline
+    python benchmarks/load_test.py --duration 30 --concurrency 20
+
+Latency only compares on the machine that recorded the baseline. Against a
+baseline from elsewhere, --report-only prints the regressions without
+failing.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import secrets
+import sys
+import time
+
+import httpx
+
+from local_stack import LocalStack
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baselines", "load_test.json")
+DEFAULT_MIX = "browse=6,auth=2,enroll_pay_notify=2,checkout=1"
+PASSWORD = "load-test-password"
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    def reset(self):
+        self.samples.clear()
+        self.errors.clear()
+
+    async def call(self, client, method, url, route, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            response = None
+        elapsed = time.perf_counter() - started
+        self.samples.setdefault(route, []).append(elapsed)
+        if response is None or response.status_code >= 400:
+            self.errors[route] = self.errors.get(route, 0) + 1
+            return None
+        return response.json()
+
+def percentile(sorted_values, p):
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+async def seed(client, courses, users):
+    course_ids = []
+    for i in range(courses):
+        response = await client.post("/courses/create", json={
+            "title": f"Course {i}", "price": round(random.uniform(5, 200), 2), "instructor": f"Instructor {i % 17}"
+        })
+        response.raise_for_status()
+        course_ids.append(response.json()["course_id"])
+    accounts = []
+    for i in range(users):
+        email = f"seed-{i}-{secrets.token_hex(4)}@load.test"
+        registered = await client.post("/users/register", json={"name": f"Seed {i}", "email": email, "password": PASSWORD})
+        registered.raise_for_status()
+        login = await client.post("/users/login", json={"email": email, "password": PASSWORD})
+        login.raise_for_status()
+        accounts.append({"user_id": login.json()["user_id"], "email": email, "token": login.json()["token"]})
+    return {"course_ids": course_ids, "accounts": accounts}
+
+async def browse(client, recorder, state, rng):
+    await recorder.call(client, "GET", "/courses/list", "GET /courses/list", params={"limit": 20})
+    for _ in range(2):
+        course_id = rng.choice(state["course_ids"])
+        await recorder.call(client, "GET", f"/courses/{course_id}", "GET /courses/{course_id}")
+
+async def auth(client, recorder, state, rng):
+    email = f"user-{secrets.token_hex(6)}@load.test"
+    registered = await recorder.call(client, "POST", "/users/register", "POST /users/register",
+                                     json={"name": "Load Test", "email": email, "password": PASSWORD})
+    if registered is None:
+        return
+    login = await recorder.call(client, "POST", "/users/login", "POST /users/login",
+                                json={"email": email, "password": PASSWORD})
+    if login is None:
+        return
+    await recorder.call(client, "GET", "/auth/me", "GET /auth/me",
+                        headers={"Authorization": f"Bearer {login['token']}"})
+
+async def enroll_pay_notify(client, recorder, state, rng):
+    account = rng.choice(state["accounts"])
+    enrollment = await recorder.call(client, "POST", "/enrollments/enroll", "POST /enrollments/enroll",
+                                     json={"user_id": account["user_id"], "course_id": rng.choice(state["course_ids"])})
+    if enrollment is None:
+        return
+    payment = await recorder.call(client, "POST", "/payments/initiate", "POST /payments/initiate", json={
+        "enrollment_id": enrollment["enrollment_id"], "amount": 49.0, "user_email": account["email"]
+    })
+    if payment is None:
+        return
+    await recorder.call(client, "POST", "/notify/success", "POST /notify/success",
+                        json={"enrollment_id": enrollment["enrollment_id"], "payment_id": payment["payment_id"]})
+
+async def checkout(client, recorder, state, rng):
+    account = rng.choice(state["accounts"])
+    await recorder.call(client, "POST", "/checkout", "POST /checkout", json={
+        "user_id": account["user_id"], "course_id": rng.choice(state["course_ids"]), "user_email": account["email"]
+    }, headers={"Authorization": f"Bearer {account['token']}", "Idempotency-Key": secrets.token_hex(8)})
+
+SCENARIOS = {"browse": browse, "auth": auth, "enroll_pay_notify": enroll_pay_notify, "checkout": checkout}
+
+def parse_mix(spec):
+    mix = {}
+    for entry in spec.split(","):
+        name, _, weight = entry.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+async def virtual_user(client, recorder, state, mix, deadline, seed_value):
+    rng = random.Random(seed_value)
+    names, weights = list(mix), list(mix.values())
+    while time.monotonic() < deadline:
+        scenario = rng.choices(names, weights)[0]
+        await SCENARIOS[scenario](client, recorder, state, rng)
+
+async def drive(gateway_url, args):
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=gateway_url, timeout=30.0, limits=limits) as client:
+        state = await seed(client, args.courses, args.users)
+        mix = parse_mix(args.mix)
+        if args.warmup > 0:
+            deadline = time.monotonic() + args.warmup
+            await asyncio.gather(*(virtual_user(client, recorder, state, mix, deadline, i) for i in range(args.concurrency)))
+            recorder.reset()
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*(virtual_user(client, recorder, state, mix, deadline, args.seed + i) for i in range(args.concurrency)))
+        elapsed = time.monotonic() - started
+    return summarize(recorder, elapsed, args)
+
+def summarize(recorder, elapsed, args):
+    routes = {}
+    for route, samples in sorted(recorder.samples.items()):
+        samples.sort()
+        routes[route] = {
+            "requests": len(samples),
+            "errors": recorder.errors.get(route, 0),
+            "throughput": round(len(samples) / elapsed, 2),
+            "p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 99) * 1000, 2)
+        }
+    total = sum(r["requests"] for r in routes.values())
+    return {
+        "config": {
+            "duration": args.duration, "concurrency": args.concurrency, "mix": args.mix,
+            "db_latency": args.db_latency, "courses": args.courses, "users": args.users
+        },
+        "elapsed": round(elapsed, 2),
+        "requests": total,
+        "errors": sum(r["errors"] for r in routes.values()),
+        "throughput": round(total / elapsed, 2),
+        "routes": routes
+    }
+
+def compare(results, baseline, tolerance, slack_ms):
+    """Return a line per route that got slower or lost throughput beyond tolerance."""
+    regressions = []
+    if results["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"overall throughput {results['throughput']} req/s < baseline {baseline['throughput']} req/s")
+    for route, base in baseline["routes"].items():
+        current = results["routes"].get(route)
+        if current is None:
+            regressions.append(f"{route}: no requests recorded")
+            continue
+        for metric in ("p95_ms", "p99_ms"):
+            limit = base[metric] * (1 + tolerance) + slack_ms
+            if current[metric] > limit:
+                regressions.append(f"{route}: {metric} {current[metric]} > {round(limit, 2)} (baseline {base[metric]})")
+        if current["errors"] > base["errors"] and current["errors"] / current["requests"] > 0.01:
+            regressions.append(f"{route}: {current['errors']} errors out of {current['requests']}")
+    return regressions
+
+def print_report(results):
+    print(f"{results['requests']} requests in {results['elapsed']}s = {results['throughput']} req/s "
+          f"({results['errors']} errors)")
+    print(f"{'route':<32} {'reqs':>7} {'errs':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, r in results["routes"].items():
+        print(f"{route:<32} {r['requests']:>7} {r['errors']:>5} {r['throughput']:>8} "
+              f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight,...")
+    parser.add_argument("--courses", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db-latency", type=float, default=0.002,
+                        help="seconds each storage call sleeps (roughly an in-region DynamoDB round trip)")
+    parser.add_argument("--gateway-url", help="drive an already running stack instead of booting one")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite --baseline with these results")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional regression")
+    parser.add_argument("--slack-ms", type=float, default=5.0, help="absolute latency slack added to the limit")
+    parser.add_argument("--report-only", action="store_true", help="print regressions but don't fail")
+    args = parser.parse_args()
+
+    if args.gateway_url:
+        results = asyncio.run(drive(args.gateway_url, args))
+    else:
+        with LocalStack(args.db_latency) as stack:
+            results = asyncio.run(drive(stack.gateway_url, args))
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["config"] != results["config"]:
+        print("Baseline was recorded with a different configuration; skipping comparison")
+        return
+    regressions = compare(results, baseline, args.tolerance, args.slack_ms)
+    if regressions:
+        print("\nRegressions against baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        if not args.report_only:
+            sys.exit(1)
+        return
+    print("\nNo regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Boots the five services and the gateway locally on the in-memory engine.
+
+Each app runs under uvicorn in its own process, exactly as it does in its
+container, with STORAGE_ENGINE=memory in place of DynamoDB. Used by
+load_test.py; it can also run on its own to keep a stack up for manual
+poking:
+
+    python benchmarks/local_stack.py --db-latency 0.002
+"""
+import argparse
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Started in dependency order; the gateway goes last
+SERVICES = ["notification-service", "user-service", "course-service", "enrollment-service", "payment-service", "swagger-ui"]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class LocalStack:
+    def __init__(self, db_latency=0.0, env=None, startup_timeout=60.0):
+        self.db_latency = db_latency
+        self.extra_env = env or {}
+        self.startup_timeout = startup_timeout
+        self.ports = {service: free_port() for service in SERVICES}
+        self.workdir = tempfile.TemporaryDirectory(prefix="learning-portal-stack-")
+        self.processes = {}
+
+    def url(self, service):
+        return f"http://127.0.0.1:{self.ports[service]}"
+
+    @property
+    def gateway_url(self):
+        return self.url("swagger-ui")
+
+    def environment(self):
+        env = dict(os.environ)
+        env.setdefault("AWS_DEFAULT_REGION", "us-east-2")
+        env.setdefault("TOKEN_SIGNING_KEYS", f"bench:{secrets.token_hex(32)}")
+        env.setdefault("TRACE_EXPORTER", "none")
+        env["STORAGE_ENGINE"] = "memory"
+        env["STORAGE_MEMORY_LATENCY"] = str(self.db_latency)
+        env["OUTBOX_PATH"] = os.path.join(self.workdir.name, "outbox.db")
+        env["BLOB_STORE_PATH"] = os.path.join(self.workdir.name, "blobs")
+        env["EXPORT_DIR"] = os.path.join(self.workdir.name, "exports")
+        for service in SERVICES[:-1]:
+            env[f"{service.split('-')[0].upper()}_SERVICE_URL"] = self.url(service)
+        env.update(self.extra_env)
+        return env
+
+    def start(self):
+        env = self.environment()
+        for service in SERVICES:
+            log = open(os.path.join(self.workdir.name, f"{service}.log"), "w")
+            self.processes[service] = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+                 "--port", str(self.ports[service]), "--log-level", "warning"],
+                cwd=os.path.join(ROOT, service), env=env, stdout=log, stderr=subprocess.STDOUT
+            )
+        for service in SERVICES:
+            self.wait_healthy(service)
+        return self
+
+    def wait_healthy(self, service):
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.processes[service].poll() is not None:
+                raise RuntimeError(f"{service} exited during startup:\n{self.log_tail(service)}")
+            try:
+                if httpx.get(f"{self.url(service)}/health", timeout=1.0).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError(f"{service} did not become healthy in {self.startup_timeout}s:\n{self.log_tail(service)}")
+
+    def log_tail(self, service, lines=20):
+        with open(os.path.join(self.workdir.name, f"{service}.log")) as f:
+            return "".join(f.readlines()[-lines:])
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.processes.clear()
+        self.workdir.cleanup()
+
+    def __enter__(self):
+        try:
+            return self.start()
+        except Exception:
+            self.stop()
+            raise
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-latency", type=float, default=0.0, help="seconds each storage call sleeps")
+    args = parser.parse_args()
+    with LocalStack(args.db_latency) as stack:
+        print(f"Gateway listening on {stack.gateway_url} (Ctrl-C to stop)")
+        for service in SERVICES[:-1]:
+            print(f"  {service}: {stack.url(service)}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
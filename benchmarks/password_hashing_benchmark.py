@@ -0,0 +1,49 @@
+"""Login throughput at each password-hashing cost setting.
+
+Every "login" is one verify_password call dispatched to the user-service
+process pool, PASSWORD_HASH_WORKERS wide (defaults to the CPU count).
+
+    python benchmarks/password_hashing_benchmark.py --logins 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "user-service"))
+import passwords
+
+COST_SETTINGS = [
+    ("scrypt", 2 ** 12, 8, 1),
+    ("scrypt", 2 ** 13, 8, 1),
+    ("scrypt", 2 ** 14, 8, 1),
+    ("scrypt", 2 ** 15, 8, 1),
+    ("pbkdf2_sha256", 100000),
+    ("pbkdf2_sha256", 600000),
+]
+
+async def run(params, logins):
+    stored = passwords.hash_password("correct horse battery staple", params)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        passwords.verify_password_async("correct horse battery staple", stored) for _ in range(logins)
+    ))
+    elapsed = time.perf_counter() - started
+    assert all(results)
+    return logins / elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"process pool workers={passwords.PASSWORD_HASH_WORKERS}")
+    for params in COST_SETTINGS:
+        label = "$".join(str(p) for p in params)
+        rate = asyncio.run(run(params, args.logins))
+        print(f"{label:<24} {rate:8.1f} logins/s")
+    passwords.shutdown_pool()
+
+if __name__ == "__main__":
+    main()
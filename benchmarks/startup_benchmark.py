@@ -0,0 +1,76 @@
+"""Cold-start time per service: process launch to the first healthy /health.
+
+Each run starts a fresh ``uvicorn app:app`` process (the container's CMD)
+and polls /health until it answers 200. The median over --runs is reported
+per service; with --target-ms, any service slower than the target fails
+the run.
+
+    python benchmarks/startup_benchmark.py --runs 5 --target-ms 1500
+
+Wall-clock startup depends on the machine; --report-only still flags
+services above the target but doesn't fail.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from local_stack import ROOT, SERVICES, free_port
+
+def measure(service, env, timeout=60.0):
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.join(ROOT, service), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    try:
+        with httpx.Client(timeout=1.0) as client:
+            while time.perf_counter() - started < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"{service} exited during startup:\n{process.stderr.read().decode()}")
+                try:
+                    if client.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                        return time.perf_counter() - started
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.005)
+        raise RuntimeError(f"{service} did not become healthy in {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--services", default=",".join(SERVICES))
+    parser.add_argument("--target-ms", type=float, help="fail when a service's median exceeds this")
+    parser.add_argument("--report-only", action="store_true", help="report services above the target but don't fail")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # Startup must not need AWS; dummy credentials keep boto3 from probing
+    # the instance metadata endpoint if anything resolves them early
+    env.setdefault("AWS_ACCESS_KEY_ID", "startup-benchmark")
+    env.setdefault("AWS_SECRET_ACCESS_KEY", "startup-benchmark")
+    env.setdefault("TRACE_EXPORTER", "none")
+
+    failed = []
+    print(f"{'service':<22} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for service in args.services.split(","):
+        samples = [measure(service, env) * 1000 for _ in range(args.runs)]
+        median = statistics.median(samples)
+        print(f"{service:<22} {median:>10.0f} {min(samples):>8.0f} {max(samples):>8.0f}")
+        if args.target_ms and median > args.target_ms:
+            failed.append(service)
+    if failed:
+        print(f"\nAbove the {args.target_ms:.0f} ms target: {', '.join(failed)}")
+        if not args.report_only:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
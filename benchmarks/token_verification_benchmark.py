@@ -0,0 +1,58 @@
+"""Per-request cost of authenticating a bearer token three ways:
+
+* local HMAC verification of a signed token (what the gateway middleware does)
+* an in-process token store lookup (what user-service does)
+* a call to user-service /users/validate over an in-process ASGI transport,
+  which is a lower bound on the real network hop
+
+    python benchmarks/token_verification_benchmark.py --iterations 20000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "user-service"))
+from signed_tokens import KeySet, sign_token, verify_token
+from token_store import MemoryTokenStore
+
+def per_call(label, iterations, fn):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<34} {elapsed / iterations * 1e6:10.2f} us/request")
+
+async def validate_over_http(iterations, token):
+    import app as user_app
+    user_app.token_store.issue(token, {"user_id": "u1", "role": "student"})
+    transport = httpx.ASGITransport(app=user_app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://user-service") as client:
+        headers = {"authorization": f"Bearer {token}"}
+        started = time.perf_counter()
+        for _ in range(iterations):
+            response = await client.get("/users/validate", headers=headers)
+            response.raise_for_status()
+        return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    keyset = KeySet(keys={"k1": b"benchmark-secret"})
+    token = sign_token({"sub": "u1", "role": "student", "exp": time.time() + 3600}, keyset)
+    store = MemoryTokenStore()
+    store.issue(token, {"user_id": "u1", "role": "student"})
+
+    per_call("signed token, local HMAC verify", args.iterations, lambda: verify_token(token, keyset))
+    per_call("in-process token store lookup", args.iterations, lambda: store.get(token))
+    http_iterations = max(1, args.iterations // 20)
+    elapsed = asyncio.run(validate_over_http(http_iterations, token))
+    print(f"{'/users/validate round trip (ASGI)':<34} {elapsed / http_iterations * 1e6:10.2f} us/request")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Throughput per vCPU of the serving modes, on one service.
+
+Runs course-service on the in-memory engine under each server
+configuration and drives GET /courses/{course_id} and GET /courses/list
+with closed-loop clients. Every worker loads the same course snapshot, so
+the read-only mix behaves as it would on a shared store.
+
+    uvicorn      the previous CMD: single uvicorn process, asyncio + h11
+    gunicorn:N   the container CMD: gunicorn, N uvicorn workers, uvloop +
+                 httptools when installed
+
+Besides req/s and latency, the CPU seconds the server processes burned are
+read from /proc, so "req/cpu-s" (requests per CPU-second, i.e. throughput
+per fully used vCPU) compares configurations even on a box with fewer
+cores than workers. Linux only.
+
+    python benchmarks/workers_benchmark.py --configs uvicorn,gunicorn:1,gunicorn:2 --duration 15
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from load_test import percentile
+from local_stack import ROOT, free_port
+
+SERVICE = "course-service"
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+def server_command(config, port):
+    if config == "uvicorn":
+        return [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+                "--loop", "asyncio", "--http", "h11", "--log-level", "warning"], 1
+    kind, _, workers = config.partition(":")
+    if kind != "gunicorn":
+        raise SystemExit(f"Unknown configuration {config!r}; use uvicorn or gunicorn:N")
+    return [sys.executable, "-m", "gunicorn", "app:app", "--worker-class", "uvicorn.workers.UvicornWorker",
+            "--bind", f"127.0.0.1:{port}", "--log-level", "warning"], int(workers or 1)
+
+def process_tree_cpu(root_pid):
+    """CPU seconds (user + system) of ``root_pid`` and all its descendants."""
+    parents = {}
+    times = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        pid = int(entry)
+        # Fields after the command name: state ppid ... utime(12) stime(13)
+        parents[pid] = int(fields[1])
+        times[pid] = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    total = 0.0
+    for pid, seconds in times.items():
+        ancestor = pid
+        while ancestor and ancestor != root_pid:
+            ancestor = parents.get(ancestor)
+        if ancestor == root_pid:
+            total += seconds
+    return total
+
+def write_snapshot(path, courses):
+    items = [{
+        "course_id": f"c{secrets.token_hex(8)}",
+        "title": f"Course {i}",
+        "price": str(round(random.uniform(5, 200), 2)),
+        "instructor": f"Instructor {i % 17}",
+        "description": "Seeded by workers_benchmark",
+        "status": "created",
+        "created_at": "2024-01-01T00:00:00"
+    } for i in range(courses)]
+    with open(path, "w") as f:
+        json.dump({"learning-portal-courses": items}, f)
+    return [item["course_id"] for item in items]
+
+async def drive(url, course_ids, concurrency, duration, warmup):
+    samples = []
+    errors = 0
+
+    async def client_loop(client, deadline, record, seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        while time.monotonic() < deadline:
+            path = "/courses/list?limit=20" if rng.random() < 0.2 else f"/courses/{rng.choice(course_ids)}"
+            started = time.perf_counter()
+            try:
+                ok = (await client.get(path)).status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if record:
+                samples.append(time.perf_counter() - started)
+                errors += not ok
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=30.0, limits=limits) as client:
+        deadline = time.monotonic() + warmup
+        await asyncio.gather(*(client_loop(client, deadline, False, i) for i in range(concurrency)))
+        started = time.monotonic()
+        deadline = started + duration
+        await asyncio.gather(*(client_loop(client, deadline, True, i) for i in range(concurrency)))
+    return samples, errors, time.monotonic() - started
+
+def run_config(config, args, env, course_ids):
+    port = free_port()
+    command, workers = server_command(config, port)
+    env = dict(env, WEB_CONCURRENCY=str(workers))
+    process = subprocess.Popen(command, cwd=os.path.join(ROOT, SERVICE), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{config} exited during startup:\n{process.stderr.read().decode()}")
+            try:
+                if httpx.get(f"{url}/health", timeout=1.0).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{config} did not become healthy")
+            time.sleep(0.1)
+        # Let every worker finish booting before counting CPU
+        time.sleep(1.0 + 0.2 * workers)
+        cpu_before = process_tree_cpu(process.pid)
+        samples, errors, elapsed = asyncio.run(drive(url, course_ids, args.concurrency, args.duration, args.warmup))
+        cpu = process_tree_cpu(process.pid) - cpu_before
+    finally:
+        process.terminate()
+        process.wait()
+    samples.sort()
+    return {
+        "config": config,
+        "workers": workers,
+        "requests": len(samples),
+        "errors": errors,
+        "throughput": round(len(samples) / elapsed, 1),
+        "cpu_seconds": round(cpu, 2),
+        "per_cpu_second": round(len(samples) / cpu, 1) if cpu else None,
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", default="uvicorn,gunicorn:1,gunicorn:2")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--courses", type=int, default=500)
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="workers-benchmark-") as workdir:
+        snapshot = os.path.join(workdir, "snapshot.json")
+        course_ids = write_snapshot(snapshot, args.courses)
+        env = dict(os.environ)
+        env.update({
+            "STORAGE_ENGINE": "memory",
+            "STORAGE_SNAPSHOT_PATH": snapshot,
+            "ALLOW_PER_PROCESS_STATE": "true",
+            "TRACE_EXPORTER": "none",
+            "BLOB_STORE_PATH": os.path.join(workdir, "blobs")
+        })
+        results = [run_config(config, args, env, course_ids) for config in args.configs.split(",")]
+
+    print(f"vCPUs available: {len(os.sched_getaffinity(0))}")
+    print(f"{'config':<14} {'workers':>7} {'reqs':>7} {'errs':>5} {'req/s':>8} {'cpu s':>7} {'req/cpu-s':>10} "
+          f"{'p50 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        print(f"{r['config']:<14} {r['workers']:>7} {r['requests']:>7} {r['errors']:>5} {r['throughput']:>8} "
+              f"{r['cpu_seconds']:>7} {r['per_cpu_second']:>10} {r['p50_ms']:>8} {r['p99_ms']:>8}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
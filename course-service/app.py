@@ -1,19 +1,73 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from typing import Optional
+import csv
+import hashlib
+import json
+import os
 import secrets
-import boto3
 from datetime import datetime
+from dynamo import BOTO_CONFIG, run_db, scan_page, scan_all, ndjson_lines
+from storage import connect_in_background, create_storage
+from models import CourseCreate
+from cache import create_cache, MISSING
+from blobstore import create_blob_store
+from metrics import MetricsMiddleware, instrument_dynamodb, metrics_response
+from tracing import TracingMiddleware, create_tracer, trace_dynamodb
 
-app = FastAPI(title="Course Service", version="1.0.0")
+tracer = create_tracer("course-service")
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-2')
-courses_table = dynamodb.Table('learning-portal-courses')
+@asynccontextmanager
+async def lifespan(app):
+    app.state.startup_tasks = [connect_in_background(storage), connect_in_background(blob_store)]
+    yield
+    for task in app.state.startup_tasks:
+        task.cancel()
 
-class CourseCreate(BaseModel):
-    title: str
-    price: float
-    instructor: str
-    description: str = ""
+app = FastAPI(title="Course Service", version="1.0.0", lifespan=lifespan)
+app.add_middleware(TracingMiddleware, tracer=tracer)
+app.add_middleware(MetricsMiddleware)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+IMPORT_MAX_REPORTED_ERRORS = 1000
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+CACHE_TTL = float(os.getenv("COURSE_CACHE_TTL", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("COURSE_CACHE_MAX_ENTRIES", "10000"))
+
+storage = create_storage(BOTO_CONFIG)
+storage.instrument(instrument_dynamodb)
+storage.instrument(trace_dynamodb, tracer)
+courses_table = storage.Table('learning-portal-courses')
+
+course_cache = create_cache("courses", CACHE_MAX_ENTRIES, CACHE_TTL)
+list_cache = create_cache("course-lists", 256, CACHE_TTL)
+blob_store = create_blob_store()
+
+def course_item(course_id, course):
+    return {
+        "course_id": course_id,
+        "title": course.title,
+        "price": str(course.price),
+        "instructor": course.instructor,
+        "description": course.description,
+        "status": "created",
+        "created_at": datetime.utcnow().isoformat()
+    }
+
+def import_rows(fileobj, fmt):
+    # Parse the upload line by line with nothing read ahead, so a bad byte
+    # is reported against its own row: an NDJSON row fails on its own, a
+    # CSV upload stops there
+    if fmt == "csv":
+        yield from csv.DictReader(line.decode("utf-8") for line in fileobj)
+        return
+    for line in fileobj:
+        if line.strip():
+            yield line
 
 @app.get("/")
 def home():
@@ -23,20 +77,22 @@ def home():
 def health():
     return {"status": "healthy", "service": "course-service"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "courses": course_cache.stats(),
+        "lists": list_cache.stats()
+    }
+
 @app.post("/courses/create")
-def create_course(course: CourseCreate):
+async def create_course(course: CourseCreate):
     course_id = f"c{secrets.token_hex(8)}"
-    courses_table.put_item(
-        Item={
-            "course_id": course_id,
-            "title": course.title,
-            "price": str(course.price),
-            "instructor": course.instructor,
-            "description": course.description,
-            "status": "created",
-            "created_at": datetime.utcnow().isoformat()
-        }
-    )
+    await run_db(courses_table, "put_item", Item=course_item(course_id, course))
+    await list_cache.aclear()
     
     return {
         "course_id": course_id,
@@ -45,21 +101,95 @@ def create_course(course: CourseCreate):
         "price": course.price
     }
 
-@app.get("/courses/list")
-def list_courses():
-    response = courses_table.scan()
+@app.post("/courses/import")
+def import_courses(
+    file: UploadFile = File(...),
+    fmt: Optional[str] = Query(None, alias="format", pattern="^(csv|ndjson)$")
+):
+    if fmt is None:
+        fmt = "csv" if (file.filename or "").lower().endswith(".csv") else "ndjson"
+
+    created = 0
+    failed = 0
+    errors = []
+    row_number = 0
+    try:
+        with courses_table.batch_writer() as batch:
+            for row_number, row in enumerate(import_rows(file.file, fmt), start=1):
+                try:
+                    if isinstance(row, bytes):
+                        row = json.loads(row.decode("utf-8"))
+                    course = CourseCreate(**row)
+                except (ValueError, TypeError, ValidationError) as e:
+                    failed += 1
+                    if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                        errors.append({"row": row_number, "error": str(e)})
+                    continue
+                batch.put_item(Item=course_item(f"c{secrets.token_hex(8)}", course))
+                created += 1
+    except (UnicodeDecodeError, csv.Error) as e:
+        # The reader itself failed, so nothing after the last parsed row
+        # can be read; the rows before it are already written
+        raise HTTPException(status_code=400, detail={
+            "error": f"unreadable input after row {row_number}: {e}",
+            "total": created + failed,
+            "created": created,
+            "failed": failed,
+            "errors": errors
+        })
+    finally:
+        list_cache.clear()
+
     return {
-        "total": len(response['Items']),
-        "courses": response['Items']
+        "status": "imported",
+        "total": created + failed,
+        "created": created,
+        "failed": failed,
+        "errors": errors
     }
 
+@app.get("/courses/list")
+def list_courses(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    next_token: Optional[str] = None,
+    stream: bool = False
+):
+    if stream:
+        return StreamingResponse(
+            ndjson_lines(scan_all(courses_table)),
+            media_type="application/x-ndjson"
+        )
+    # Without a limit this is the first page, not the whole table; full
+    # walks go through stream=true so only one page is held at a time
+    limit = limit or DEFAULT_PAGE_SIZE
+    cache_key = f"{limit}:{next_token}"
+    cached = list_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
+    try:
+        courses, token = scan_page(courses_table, limit, next_token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = {
+        "total": len(courses),
+        "courses": courses,
+        "next_token": token
+    }
+    list_cache.set(cache_key, result)
+    return result
+
 @app.get("/courses/{course_id}")
-def get_course(course_id: str):
-    response = courses_table.get_item(Key={'course_id': course_id})
+async def get_course(course_id: str):
+    cached = await course_cache.aget(course_id)
+    if cached is not MISSING:
+        return cached
+
+    response = await run_db(courses_table, "get_item", Key={'course_id': course_id})
     
     if 'Item' not in response:
         raise HTTPException(status_code=404, detail="Course not found")
     
+    await course_cache.aset(course_id, response['Item'])
     return response['Item']
 
 @app.post("/courses/upload")
@@ -67,29 +197,50 @@ async def upload_course_material(
     course_id: str,
     file: UploadFile = File(...)
 ):
-    response = courses_table.get_item(Key={'course_id': course_id})
+    response = await run_db(courses_table, "get_item", Key={'course_id': course_id})
     
     if 'Item' not in response:
         raise HTTPException(status_code=404, detail="Course not found")
     
-    file_content = await file.read()
+    key = f"courses/{course_id}/{secrets.token_hex(8)}-{os.path.basename(file.filename or 'upload')}"
+    writer = await run_in_threadpool(blob_store.open, key)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            await run_in_threadpool(writer.write, chunk)
+        await run_in_threadpool(writer.commit)
+    except Exception:
+        await run_in_threadpool(writer.abort)
+        raise
+
     file_metadata = {
         "filename": file.filename,
         "content_type": file.content_type,
-        "size": len(file_content),
+        "size": size,
+        "sha256": digest.hexdigest(),
+        "location": blob_store.location(key),
         "uploaded_at": datetime.utcnow().isoformat()
     }
     
-    courses_table.update_item(
+    await run_db(
+        courses_table, "update_item",
         Key={'course_id': course_id},
         UpdateExpression="SET file_metadata = :metadata",
         ExpressionAttributeValues={':metadata': file_metadata}
     )
+    await course_cache.adelete(course_id)
+    await list_cache.aclear()
     
     return {
         "status": "uploaded",
         "course_id": course_id,
         "file": file_metadata,
-        "message": "File metadata stored successfully"
+        "message": "File stored successfully"
     }
 
@@ -0,0 +1,123 @@
+import os
+import threading
+
+from storage import DYNAMODB_REGION
+
+class LocalBlobWriter:
+    def __init__(self, path):
+        self.path = path
+        self.partial_path = f"{path}.part"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(self.partial_path, "wb")
+
+    def write(self, chunk):
+        self.file.write(chunk)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.partial_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+class LocalBlobStore:
+    """Stores blobs as files under a root directory."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def open(self, key):
+        return LocalBlobWriter(os.path.join(self.root, key))
+
+    def location(self, key):
+        return f"file://{os.path.join(self.root, key)}"
+
+    def connect(self):
+        return self
+
+class S3BlobWriter:
+    def __init__(self, client, bucket, key, part_size):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.parts = []
+        self.upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+
+    def _upload_part(self):
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=bytes(self.buffer)
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self.buffer.clear()
+
+    def write(self, chunk):
+        # S3 parts must be at least 5 MB, so this buffers up to one part
+        self.buffer += chunk
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+
+    def commit(self):
+        if self.buffer or not self.parts:
+            self._upload_part()
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts}
+        )
+
+    def abort(self):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+class S3BlobStore:
+    """Stores blobs in S3 or any S3-compatible server via multipart upload.
+
+    The boto3 client is built on first use (or by ``connect`` from the
+    lifespan), not at import, like the DynamoDB engine's.
+    """
+
+    def __init__(self, bucket, region=DYNAMODB_REGION, endpoint_url=None, part_size=8 * 1024 * 1024):
+        self.bucket = bucket
+        self.region = region
+        self.endpoint_url = endpoint_url
+        self.part_size = part_size
+        self.lock = threading.Lock()
+        self._client = None
+
+    @property
+    def client(self):
+        return self._client or self.connect()
+
+    def connect(self):
+        with self.lock:
+            if self._client is None:
+                import boto3
+                self._client = boto3.client("s3", region_name=self.region, endpoint_url=self.endpoint_url)
+            return self._client
+
+    def open(self, key):
+        return S3BlobWriter(self.client, self.bucket, key, self.part_size)
+
+    def location(self, key):
+        return f"s3://{self.bucket}/{key}"
+
+def create_blob_store():
+    backend = os.getenv("BLOB_STORE", "local")
+    if backend == "s3":
+        return S3BlobStore(
+            os.getenv("BLOB_STORE_BUCKET", "learning-portal-course-materials"),
+            region=os.getenv("BLOB_STORE_REGION") or DYNAMODB_REGION,
+            endpoint_url=os.getenv("BLOB_STORE_ENDPOINT_URL") or None
+        )
+    if backend != "local":
+        raise ValueError(f"Unknown BLOB_STORE: {backend}")
+    return LocalBlobStore(os.getenv("BLOB_STORE_PATH", "/tmp/course-materials"))
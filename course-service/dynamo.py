@@ -0,0 +1,194 @@
+import asyncio
+import base64
+import contextvars
+import csv
+import functools
+import io
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+logger = logging.getLogger(__name__)
+
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "32"))
+
+# boto3 keeps 10 pooled connections by default; match it to the executor so
+# worker threads don't queue for a connection
+BOTO_CONFIG = Config(max_pool_connections=DB_EXECUTOR_WORKERS)
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="dynamodb")
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking boto3 call on the bounded DynamoDB executor.
+
+    ``fn`` is a callable, or a table followed by the name of the method to
+    call, as in ``run_db(table, "get_item", Key=...)``. The second form
+    looks the method up on the worker thread too, so a table's first use
+    never builds the boto3 resource (or waits for it) on the event loop.
+    """
+    if not callable(fn):
+        fn, args = _call_method, (fn, *args)
+    loop = asyncio.get_running_loop()
+    # Carry contextvars (the current trace span) over to the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_db_executor, functools.partial(context.run, fn, *args, **kwargs))
+
+def _call_method(table, method, *args, **kwargs):
+    return getattr(table, method)(*args, **kwargs)
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def encode_token(last_evaluated_key):
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, default=json_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_token(next_token):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(next_token.encode()))
+    except ValueError:
+        raise ValueError("Invalid next_token")
+    if not isinstance(key, dict):
+        raise ValueError("Invalid next_token")
+    return key
+
+def scan_page(table, limit, next_token=None, **kwargs):
+    params = dict(kwargs, Limit=limit)
+    if next_token:
+        params["ExclusiveStartKey"] = decode_token(next_token)
+    response = table.scan(**params)
+    return response["Items"], encode_token(response.get("LastEvaluatedKey"))
+
+def query_page(table, limit, next_token=None, **kwargs):
+    params = dict(kwargs, Limit=limit)
+    if next_token:
+        params["ExclusiveStartKey"] = decode_token(next_token)
+    response = table.query(**params)
+    return response["Items"], encode_token(response.get("LastEvaluatedKey"))
+
+def scan_all(table, **kwargs):
+    # Lazily walks every page, so only one page is held in memory at a time
+    params = dict(kwargs)
+    while True:
+        response = table.scan(**params)
+        yield from response["Items"]
+        last_evaluated_key = response.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            return
+        params["ExclusiveStartKey"] = last_evaluated_key
+
+def ndjson_lines(items, transform=None):
+    for item in items:
+        if transform is not None:
+            item = transform(item)
+        yield json.dumps(item, default=json_default) + "\n"
+
+_SEGMENT_DONE = object()
+
+def parallel_scan(table, total_segments, max_workers=None, queue_size=16):
+    # Each segment is scanned by a worker thread; pages go through a bounded
+    # queue so memory stays flat however large the table is
+    pages = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(page):
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def scan_segment(segment):
+        try:
+            params = {"Segment": segment, "TotalSegments": total_segments}
+            while not stop.is_set():
+                response = table.scan(**params)
+                put(response["Items"])
+                last_evaluated_key = response.get("LastEvaluatedKey")
+                if not last_evaluated_key:
+                    break
+                params["ExclusiveStartKey"] = last_evaluated_key
+        except Exception as e:
+            put(e)
+        finally:
+            put(_SEGMENT_DONE)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or total_segments)
+    for segment in range(total_segments):
+        executor.submit(scan_segment, segment)
+    remaining = total_segments
+    try:
+        while remaining:
+            page = pages.get()
+            if page is _SEGMENT_DONE:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield from page
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+class ExportStats:
+    def __init__(self, segments):
+        self.segments = segments
+        self.items = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            "segments": self.segments,
+            "items": self.items,
+            "bytes": self.bytes,
+            "seconds": round(elapsed, 3),
+            "items_per_second": round(self.items / elapsed, 1) if elapsed else 0.0
+        }
+
+def export_chunks(items, fmt, stats, fields=None, chunk_size=64 * 1024, progress_every=10000):
+    # Yields gzip-compressed NDJSON or CSV chunks of roughly chunk_size bytes
+    compressor = zlib.compressobj(wbits=31)
+    buffer = io.StringIO()
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+    for item in items:
+        if writer is not None:
+            writer.writerow({k: json_default(v) if isinstance(v, Decimal) else v for k, v in item.items()})
+        else:
+            buffer.write(json.dumps(item, default=json_default) + "\n")
+        stats.items += 1
+        if stats.items % progress_every == 0:
+            logger.info("export progress: %s", stats.report())
+        if buffer.tell() >= chunk_size:
+            chunk = compressor.compress(buffer.getvalue().encode())
+            buffer.seek(0)
+            buffer.truncate()
+            if chunk:
+                stats.bytes += len(chunk)
+                yield chunk
+    chunk = compressor.compress(buffer.getvalue().encode()) + compressor.flush()
+    stats.bytes += len(chunk)
+    yield chunk
+    logger.info("export finished: %s", stats.report())
+
+def export_to_file(items, path, fmt, stats, fields=None):
+    with open(path, "wb") as f:
+        for chunk in export_chunks(items, fmt, stats, fields):
+            f.write(chunk)
+    return stats.report()
@@ -0,0 +1,24 @@
+"""Worker-count awareness for state kept in process memory.
+
+The container runs gunicorn with uvicorn workers. Gunicorn (and uvicorn's
+own ``--workers``) take the worker count from WEB_CONCURRENCY, so the app
+reads the same variable to know whether module-level state is private to
+one of several processes. State that must be consistent across requests
+(sessions, tables) refuses to start multi-worker unless it is backed by a
+shared store; caches only need to tolerate staleness up to their TTL, as
+they already do across ECS tasks.
+"""
+import os
+
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+# Escape hatch for benchmarks that load identical read-only data per worker
+ALLOW_PER_PROCESS_STATE = os.getenv("ALLOW_PER_PROCESS_STATE", "false").lower() == "true"
+
+def require_shared(name, shared, hint):
+    """Raise at startup when ``name`` lives per process but several workers serve requests."""
+    if WORKERS > 1 and not shared and not ALLOW_PER_PROCESS_STATE:
+        raise RuntimeError(f"{name} is per-process but WEB_CONCURRENCY={WORKERS}; {hint}")
+
+def per_worker(total):
+    """Split a per-host resource budget (CPU-bound pools) evenly across workers."""
+    return max(1, total // WORKERS)
@@ -0,0 +1,390 @@
+"""Storage engines behind the ``Table`` calls the services make.
+
+STORAGE_ENGINE=dynamodb (the default) hands out boto3 DynamoDB tables.
+STORAGE_ENGINE=memory keeps every table in process, for tests, benchmarks
+and single-node deployments. It implements the subset of the Table API the
+services use (conditional put/update, get, paginated and segmented scan,
+GSI queries and batch_writer) with the same error codes, so handlers run
+unchanged on either engine.
+"""
+import asyncio
+import atexit
+import copy
+import json
+import logging
+import os
+import re
+import threading
+import time
+from itertools import islice
+
+from botocore.exceptions import ClientError
+
+from serving import require_shared
+
+logger = logging.getLogger(__name__)
+
+STORAGE_ENGINE = os.getenv("STORAGE_ENGINE", "dynamodb")
+DYNAMODB_REGION = os.getenv("DYNAMODB_REGION", "us-east-2")
+DYNAMODB_ENDPOINT_URL = os.getenv("DYNAMODB_ENDPOINT_URL") or None
+STORAGE_SNAPSHOT_PATH = os.getenv("STORAGE_SNAPSHOT_PATH") or None
+STORAGE_MEMORY_LATENCY = float(os.getenv("STORAGE_MEMORY_LATENCY", "0"))
+
+# table -> (hash key, {index name: index hash key}, attributes stored in slots)
+SCHEMAS = {
+    "learning-portal-users": (
+        "user_id", {"EmailIndex": "email"},
+        ("name", "email", "password", "role", "created_at")
+    ),
+    "learning-portal-courses": (
+        "course_id", {},
+        ("title", "description", "instructor", "price", "created_at", "file_metadata")
+    ),
+    "learning-portal-enrollments": (
+        "enrollment_id", {"UserIndex": "user_id"},
+        ("user_id", "course_id", "status", "created_at", "updated_at")
+    ),
+    "learning-portal-payments": (
+        "payment_id", {},
+        ("enrollment_id", "amount", "method", "status", "created_at")
+    ),
+    "learning-portal-notifications": (
+        "notification_id", {},
+        ("user_email", "subject", "body", "type", "data", "status", "timestamp")
+    ),
+}
+
+CONDITION = re.compile(r"^(attribute_exists|attribute_not_exists)\((\w+)\)$")
+
+def _copy(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return copy.deepcopy(value)
+
+class Record:
+    """Base for the per-table record classes; known attributes live in slots."""
+
+    __slots__ = ("extra",)
+    fields = frozenset()
+
+    def __init__(self, item):
+        self.extra = None
+        for name, value in item.items():
+            self.set(name, value)
+
+    def set(self, name, value):
+        if name in self.fields:
+            setattr(self, name, _copy(value))
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[name] = _copy(value)
+
+    def get(self, name, default=None):
+        if name in self.fields:
+            return getattr(self, name, default)
+        return self.extra.get(name, default) if self.extra else default
+
+    def to_item(self, attributes=None):
+        if attributes is None:
+            item = {name: _copy(getattr(self, name)) for name in self.__slots__ if name != "extra" and hasattr(self, name)}
+            if self.extra:
+                item.update((name, _copy(value)) for name, value in self.extra.items())
+            return item
+        missing = object()
+        item = {}
+        for name in attributes:
+            value = self.get(name, missing)
+            if value is not missing:
+                item[name] = _copy(value)
+        return item
+
+def record_type(table_name, hash_key, attributes):
+    fields = tuple(dict.fromkeys((hash_key,) + tuple(attributes)))
+    class_name = "".join(part.title() for part in table_name.split("-")) + "Record"
+    return type(class_name, (Record,), {"__slots__": fields, "fields": frozenset(fields)})
+
+def _condition_failed(operation):
+    return ClientError(
+        {"Error": {"Code": "ConditionalCheckFailedException", "Message": "The conditional request failed"}},
+        operation
+    )
+
+def _projection(expression, names):
+    if not expression:
+        return None
+    return [(names or {}).get(a.strip(), a.strip()) for a in expression.split(",")]
+
+class MemoryTable:
+    def __init__(self, name, latency=0.0):
+        self.name = name
+        self.hash_key, self.index_keys, attributes = SCHEMAS.get(name, ("id", {}, ()))
+        self.record_type = record_type(name, self.hash_key, attributes + tuple(self.index_keys.values()))
+        self.latency = latency
+        self.records = {}
+        # Insertion order plus each key's position, so scans page by slicing
+        self.keys = []
+        self.positions = {}
+        # index name -> indexed value -> keys in insertion order
+        self.indexes = {index: {} for index in self.index_keys}
+        self.lock = threading.RLock()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _check(self, condition, key, operation):
+        if not condition:
+            return
+        match = CONDITION.match(condition.strip()) if isinstance(condition, str) else None
+        if match is None:
+            raise NotImplementedError(f"Unsupported condition: {condition}")
+        if (key in self.records) != (match.group(1) == "attribute_exists"):
+            raise _condition_failed(operation)
+
+    def _unindex(self, key, record):
+        for index, attribute in self.index_keys.items():
+            value = record.get(attribute)
+            if value is not None:
+                keys = self.indexes[index].get(value)
+                keys.remove(key)
+                if not keys:
+                    del self.indexes[index][value]
+
+    def _index(self, key, record):
+        for index, attribute in self.index_keys.items():
+            value = record.get(attribute)
+            if value is not None:
+                self.indexes[index].setdefault(value, []).append(key)
+
+    def _store(self, key, record):
+        previous = self.records.get(key)
+        if previous is None:
+            self.positions[key] = len(self.keys)
+            self.keys.append(key)
+        else:
+            self._unindex(key, previous)
+        self.records[key] = record
+        self._index(key, record)
+
+    def put_item(self, Item, ConditionExpression=None, **kwargs):
+        self._wait()
+        key = Item[self.hash_key]
+        record = self.record_type(Item)
+        with self.lock:
+            self._check(ConditionExpression, key, "PutItem")
+            self._store(key, record)
+        return {}
+
+    def get_item(self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        self._wait()
+        with self.lock:
+            record = self.records.get(Key[self.hash_key])
+            if record is None:
+                return {}
+            return {"Item": record.to_item(_projection(ProjectionExpression, ExpressionAttributeNames))}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, ExpressionAttributeNames=None,
+                    ConditionExpression=None, ReturnValues=None, **kwargs):
+        self._wait()
+        if not UpdateExpression.startswith("SET "):
+            raise NotImplementedError(f"Unsupported update: {UpdateExpression}")
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        key = Key[self.hash_key]
+        with self.lock:
+            self._check(ConditionExpression, key, "UpdateItem")
+            previous = self.records.get(key)
+            item = previous.to_item() if previous is not None else dict(Key)
+            for assignment in UpdateExpression[4:].split(","):
+                attribute, _, placeholder = assignment.partition("=")
+                attribute = attribute.strip()
+                item[names.get(attribute, attribute)] = values[placeholder.strip()]
+            record = self.record_type(item)
+            self._store(key, record)
+            if ReturnValues == "ALL_NEW":
+                return {"Attributes": record.to_item()}
+        return {}
+
+    def _page(self, keys, start, step, limit, attributes, last_key):
+        end = len(keys)
+        indices = range(start, end, step)
+        if limit is not None:
+            indices = islice(indices, limit)
+        items = []
+        last = None
+        for i in indices:
+            items.append(self.records[keys[i]].to_item(attributes))
+            last = i
+        response = {"Items": items, "Count": len(items), "ScannedCount": len(items)}
+        if last is not None and last + step < end:
+            response["LastEvaluatedKey"] = last_key(keys[last])
+        return response
+
+    def scan(self, Limit=None, ExclusiveStartKey=None, Segment=None, TotalSegments=None,
+             ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        self._wait()
+        attributes = _projection(ProjectionExpression, ExpressionAttributeNames)
+        with self.lock:
+            start = self.positions[ExclusiveStartKey[self.hash_key]] + 1 if ExclusiveStartKey else 0
+            step = 1
+            if TotalSegments:
+                # Segment n owns every TotalSegments-th position starting at n
+                step = TotalSegments
+                start += (Segment - start) % TotalSegments
+            return self._page(self.keys, start, step, Limit, attributes, lambda k: {self.hash_key: k})
+
+    def query(self, KeyConditionExpression, IndexName=None, Limit=None, ExclusiveStartKey=None,
+              ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        self._wait()
+        expression = KeyConditionExpression.get_expression()
+        if expression["operator"] != "=":
+            raise NotImplementedError("Only equality key conditions are supported")
+        attribute, value = expression["values"][0].name, expression["values"][1]
+        attributes = _projection(ProjectionExpression, ExpressionAttributeNames)
+        with self.lock:
+            if IndexName is None:
+                keys = [value] if attribute == self.hash_key and value in self.records else []
+            else:
+                if self.index_keys.get(IndexName) != attribute:
+                    raise ClientError(
+                        {"Error": {"Code": "ValidationException", "Message": f"Unknown index {IndexName} on {attribute}"}},
+                        "Query"
+                    )
+                keys = self.indexes[IndexName].get(value, [])
+            start = keys.index(ExclusiveStartKey[self.hash_key]) + 1 if ExclusiveStartKey else 0
+            return self._page(keys, start, 1, Limit, attributes, lambda k: {self.hash_key: k, attribute: value})
+
+    def batch_writer(self, **kwargs):
+        return MemoryBatchWriter(self)
+
+    def dump(self):
+        with self.lock:
+            return [self.records[key].to_item() for key in self.keys]
+
+class MemoryBatchWriter:
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def put_item(self, Item):
+        self.table.put_item(Item=Item)
+
+class MemoryEngine:
+    """In-process tables, optionally snapshotted to a JSON file on exit."""
+
+    def __init__(self, latency=0.0, snapshot_path=None):
+        self.latency = latency
+        self.snapshot_path = snapshot_path
+        self.tables = {}
+        self.lock = threading.Lock()
+        if snapshot_path:
+            self.load(snapshot_path)
+            atexit.register(self.save, snapshot_path)
+
+    def Table(self, name):
+        with self.lock:
+            table = self.tables.get(name)
+            if table is None:
+                table = self.tables[name] = MemoryTable(name, self.latency)
+            return table
+
+    def connect(self):
+        return self
+
+    def instrument(self, hook, *args):
+        # The hooks listen for botocore events, which this engine never emits
+        pass
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return
+        for name, items in snapshot.items():
+            table = self.Table(name)
+            with table.lock:
+                for item in items:
+                    table._store(item[table.hash_key], table.record_type(item))
+
+    def save(self, path):
+        snapshot = {name: table.dump() for name, table in self.tables.items()}
+        # Per-process temporary name: several workers may exit at once
+        part = f"{path}.{os.getpid()}.part"
+        with open(part, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(part, path)
+
+class LazyTable:
+    """Stands in for a boto3 Table until first use, so importing a service
+    doesn't pay for building the DynamoDB client."""
+
+    __slots__ = ("engine", "name", "table")
+
+    def __init__(self, engine, name):
+        self.engine = engine
+        self.name = name
+        self.table = None
+
+    def __getattr__(self, attribute):
+        if self.table is None:
+            self.table = self.engine.resource.Table(self.name)
+        return getattr(self.table, attribute)
+
+class DynamoDBEngine:
+    def __init__(self, config=None, region=DYNAMODB_REGION, endpoint_url=DYNAMODB_ENDPOINT_URL):
+        self.config = config
+        self.region = region
+        self.endpoint_url = endpoint_url
+        self.hooks = []
+        self.lock = threading.Lock()
+        self._resource = None
+
+    @property
+    def resource(self):
+        return self._resource or self.connect()
+
+    def connect(self):
+        with self.lock:
+            if self._resource is None:
+                import boto3
+                resource = boto3.resource('dynamodb', region_name=self.region, endpoint_url=self.endpoint_url, config=self.config)
+                for hook, args in self.hooks:
+                    hook(resource, *args)
+                self._resource = resource
+            return self._resource
+
+    def Table(self, name):
+        return LazyTable(self, name)
+
+    def instrument(self, hook, *args):
+        with self.lock:
+            if self._resource is None:
+                self.hooks.append((hook, args))
+                return
+        hook(self._resource, *args)
+
+def connect_in_background(engine):
+    """Build the engine's client in a thread once the server is accepting
+    connections rather than at import, so /health is up while boto3 loads
+    its models. Keep the returned task: a failure is logged, and the first
+    request that needs the client tries again."""
+    task = asyncio.create_task(asyncio.to_thread(engine.connect))
+    task.add_done_callback(_log_connect_failure)
+    return task
+
+def _log_connect_failure(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("storage connect failed; retrying on first use", exc_info=task.exception())
+
+def create_storage(config=None):
+    if STORAGE_ENGINE == "memory":
+        require_shared("STORAGE_ENGINE=memory", False, "each worker would hold its own tables; use dynamodb")
+        return MemoryEngine(STORAGE_MEMORY_LATENCY, STORAGE_SNAPSHOT_PATH)
+    return DynamoDBEngine(config)
@@ -23,3 +23,223 @@ def test_get_nonexistent_course():
     response = client.get("/courses/nonexistent-id")
     assert response.status_code == 404
 
+def test_list_courses_invalid_limit():
+    response = client.get("/courses/list", params={"limit": 0})
+    assert response.status_code == 422
+
+def test_list_courses_invalid_next_token():
+    response = client.get("/courses/list", params={"limit": 10, "next_token": "not-a-token"})
+    assert response.status_code == 400
+
+class FakeCoursesTable:
+    def __init__(self):
+        self.items = {"c1": {"course_id": "c1", "title": "Python", "price": "10.0"}}
+        self.get_calls = 0
+
+    def get_item(self, Key):
+        self.get_calls += 1
+        item = self.items.get(Key["course_id"])
+        return {"Item": item} if item else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues):
+        self.items[Key["course_id"]]["file_metadata"] = ExpressionAttributeValues[":metadata"]
+
+    def batch_writer(self):
+        table = self
+
+        class Writer:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def put_item(self, Item):
+                table.items[Item["course_id"]] = Item
+
+        return Writer()
+
+def test_get_course_uses_cache(monkeypatch):
+    import app as course_app
+    table = FakeCoursesTable()
+    monkeypatch.setattr(course_app, "courses_table", table)
+    course_app.course_cache.clear()
+    assert client.get("/courses/c1").json()["title"] == "Python"
+    assert client.get("/courses/c1").json()["title"] == "Python"
+    assert table.get_calls == 1
+
+def test_upload_invalidates_course_cache(monkeypatch, tmp_path):
+    import app as course_app
+    from blobstore import LocalBlobStore
+    table = FakeCoursesTable()
+    monkeypatch.setattr(course_app, "courses_table", table)
+    monkeypatch.setattr(course_app, "blob_store", LocalBlobStore(str(tmp_path)))
+    course_app.course_cache.clear()
+    client.get("/courses/c1")
+    response = client.post("/courses/upload", params={"course_id": "c1"}, files={"file": ("a.txt", b"abc", "text/plain")})
+    assert response.status_code == 200
+    assert client.get("/courses/c1").json()["file_metadata"]["size"] == 3
+
+def test_upload_streams_to_blob_store(monkeypatch, tmp_path):
+    import hashlib
+    import app as course_app
+    from blobstore import LocalBlobStore
+    monkeypatch.setattr(course_app, "courses_table", FakeCoursesTable())
+    monkeypatch.setattr(course_app, "blob_store", LocalBlobStore(str(tmp_path)))
+    monkeypatch.setattr(course_app, "UPLOAD_CHUNK_SIZE", 1024)
+    content = bytes(range(256)) * 50
+    response = client.post("/courses/upload", params={"course_id": "c1"}, files={"file": ("video.bin", content, "application/octet-stream")})
+    metadata = response.json()["file"]
+    assert metadata["size"] == len(content)
+    assert metadata["sha256"] == hashlib.sha256(content).hexdigest()
+    stored_path = metadata["location"][len("file://"):]
+    with open(stored_path, "rb") as f:
+        assert f.read() == content
+
+def test_lru_cache_eviction():
+    from cache import LRUCache, MISSING
+    cache = LRUCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+def test_import_courses_csv(monkeypatch):
+    import app as course_app
+    table = FakeCoursesTable()
+    monkeypatch.setattr(course_app, "courses_table", table)
+    csv_body = "title,price,instructor,description\nGo,12.5,Rob,\nRust,not-a-price,Ann,\nSQL,5,Ed,Basics\n"
+    response = client.post("/courses/import", files={"file": ("catalog.csv", csv_body.encode(), "text/csv")})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["created"] == 2
+    assert body["failed"] == 1
+    assert body["errors"][0]["row"] == 2
+    assert len(table.items) == 3
+
+def test_import_courses_ndjson(monkeypatch):
+    import app as course_app
+    table = FakeCoursesTable()
+    monkeypatch.setattr(course_app, "courses_table", table)
+    ndjson_body = '{"title": "Go", "price": 1, "instructor": "Rob"}\nnot json\n{"title": "Rust"}\n'
+    response = client.post("/courses/import", files={"file": ("catalog.ndjson", ndjson_body.encode(), "application/x-ndjson")})
+    body = response.json()
+    assert body["created"] == 1
+    assert [e["row"] for e in body["errors"]] == [2, 3]
+
+def test_import_courses_undecodable_upload(monkeypatch):
+    import app as course_app
+    table = FakeCoursesTable()
+    monkeypatch.setattr(course_app, "courses_table", table)
+    rows = "".join(f"Course {i},10,Ann,An introduction to topic {i}\n" for i in range(50))
+    body = f"title,price,instructor,description\n{rows}".encode() + b"Rust,\xff\xfe,Ann,\n" * 50
+    response = client.post("/courses/import", files={"file": ("catalog.csv", body, "text/csv")})
+    assert response.status_code == 400
+    detail = response.json()["detail"]
+    assert detail["created"] == 50
+    assert detail["error"].startswith("unreadable input after row 50:")
+    assert len(table.items) == 51
+
+    ndjson_body = b'{"title": "Go", "price": 1, "instructor": "Rob"}\n{"title": "\xff"}\n{"title": "SQL", "price": 2, "instructor": "Ed"}\n'
+    response = client.post("/courses/import", files={"file": ("catalog.ndjson", ndjson_body, "application/x-ndjson")})
+    assert response.json()["created"] == 2
+    assert [e["row"] for e in response.json()["errors"]] == [2]
+
+def test_metrics_labelled_by_route_template(monkeypatch):
+    import app as course_app
+    monkeypatch.setattr(course_app, "courses_table", FakeCoursesTable())
+    course_app.course_cache.clear()
+    client.get("/courses/c1")
+    client.get("/courses/missing")
+    body = client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/courses/{course_id}",status="200"}' in body
+    assert 'http_requests_total{method="GET",route="/courses/{course_id}",status="404"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/courses/{course_id}",le="+Inf"}' in body
+    assert "/courses/c1" not in body
+
+def test_dynamodb_calls_are_timed():
+    import boto3
+    from botocore.stub import Stubber
+    from metrics import Metrics, instrument_dynamodb
+    metrics = Metrics()
+    resource = boto3.resource("dynamodb", region_name="us-east-2")
+    instrument_dynamodb(resource, metrics)
+    with Stubber(resource.meta.client) as stubber:
+        stubber.add_response("get_item", {}, {"TableName": "learning-portal-courses", "Key": {"course_id": {"S": "c1"}}})
+        resource.meta.client.get_item(TableName="learning-portal-courses", Key={"course_id": {"S": "c1"}})
+    assert metrics.dependency_calls == {("dynamodb", "GetItem", "ok"): 1}
+    assert 'dependency_call_duration_seconds_count{dependency="dynamodb",operation="GetItem"} 1' in metrics.render()
+
+def test_dynamodb_span_parented_across_executor():
+    import asyncio
+    import boto3
+    from botocore.stub import Stubber
+    from dynamo import run_db
+    from tracing import MemoryExporter, Tracer, trace_dynamodb
+    tracer = Tracer("course-service", MemoryExporter(), sample_rate=1.0)
+    resource = boto3.resource("dynamodb", region_name="us-east-2")
+    trace_dynamodb(resource, tracer)
+    params = {"TableName": "learning-portal-courses", "Key": {"course_id": {"S": "c1"}}}
+
+    async def handler():
+        with tracer.span("GET /courses/{course_id}", "server") as span:
+            await run_db(resource.meta.client.get_item, **params)
+        return span
+
+    with Stubber(resource.meta.client) as stubber:
+        stubber.add_response("get_item", {}, params)
+        span = asyncio.run(handler())
+    db_span, server_span = tracer.exporter.spans
+    assert db_span["name"] == "dynamodb.GetItem"
+    assert db_span["attributes"]["db.table"] == "learning-portal-courses"
+    assert db_span["parent_id"] == span.context.span_id == server_span["span_id"]
+
+def test_list_without_limit_returns_first_page(monkeypatch):
+    import app as course_app
+    from cache import LRUCache
+    from storage import MemoryEngine
+    table = MemoryEngine().Table("learning-portal-courses")
+    for i in range(course_app.DEFAULT_PAGE_SIZE + 5):
+        table.put_item(Item={"course_id": f"c{i}", "title": f"Course {i}"})
+    monkeypatch.setattr(course_app, "courses_table", table)
+    monkeypatch.setattr(course_app, "list_cache", LRUCache())
+    first = client.get("/courses/list").json()
+    assert first["total"] == course_app.DEFAULT_PAGE_SIZE
+    rest = client.get("/courses/list", params={"limit": 10, "next_token": first["next_token"]}).json()
+    assert [c["course_id"] for c in rest["courses"]] == [f"c{i}" for i in range(100, 105)]
+    assert rest["next_token"] is None
+    streamed = client.get("/courses/list", params={"stream": "true"}).text.splitlines()
+    assert len(streamed) == course_app.DEFAULT_PAGE_SIZE + 5
+
+def test_run_db_resolves_lazy_table_on_worker_thread():
+    import asyncio
+    import threading
+    from dynamo import run_db
+    from storage import LazyTable
+    resolved_on = []
+
+    class FakeEngine:
+        @property
+        def resource(self):
+            resolved_on.append(threading.current_thread().name)
+            return self
+
+        def Table(self, name):
+            return FakeCoursesTable()
+
+    table = LazyTable(FakeEngine(), "learning-portal-courses")
+    response = asyncio.run(run_db(table, "get_item", Key={"course_id": "c1"}))
+    assert response["Item"]["title"] == "Python"
+    assert resolved_on[0].startswith("dynamodb")
+
+def test_s3_blob_store_builds_client_on_first_use(monkeypatch):
+    import blobstore
+    monkeypatch.setenv("BLOB_STORE", "s3")
+    monkeypatch.setenv("BLOB_STORE_REGION", "eu-west-1")
+    store = blobstore.create_blob_store()
+    assert store._client is None
+    assert store.connect().meta.region_name == "eu-west-1"
+    assert store.client is store.connect()
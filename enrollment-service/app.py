@@ -1,21 +1,60 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import httpx
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Header
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import os
 import secrets
-import boto3
 from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
 from datetime import datetime
+from cache import create_cache, MISSING
+from idempotency import IdempotencyStore, IdempotencyConflict, idempotent_id, request_fingerprint
+from dynamo import BOTO_CONFIG, run_db, query_page, scan_page, scan_all, ndjson_lines, parallel_scan, export_chunks, export_to_file, ExportStats
+from storage import connect_in_background, create_storage
+from models import EnrollmentCreate, EnrollmentStatusUpdate
+from metrics import MetricsMiddleware, instrument_dynamodb, metrics_response
+from tracing import TracingMiddleware, create_tracer, trace_dynamodb
 
-app = FastAPI(title="Enrollment Service", version="1.0.0")
+tracer = create_tracer("enrollment-service")
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.startup_tasks = [connect_in_background(storage)]
+    yield
+    for task in app.state.startup_tasks:
+        task.cancel()
+
+app = FastAPI(title="Enrollment Service", version="1.0.0", lifespan=lifespan)
+app.add_middleware(TracingMiddleware, tracer=tracer)
+app.add_middleware(MetricsMiddleware)
 
 PAYMENT_SERVICE_URL = "http://payment-service.learning-portal.local:8080"
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-2')
-enrollments_table = dynamodb.Table('learning-portal-enrollments')
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_DIR = os.getenv("EXPORT_DIR", "/tmp/exports")
+EXPORT_MAX_SEGMENTS = 64
+EXPORT_FIELDS = ["enrollment_id", "user_id", "course_id", "status", "created_at"]
+USER_CACHE_TTL = float(os.getenv("ENROLLMENT_CACHE_TTL", "15"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("ENROLLMENT_CACHE_MAX_ENTRIES", "10000"))
+
+storage = create_storage(BOTO_CONFIG)
+storage.instrument(instrument_dynamodb)
+storage.instrument(trace_dynamodb, tracer)
+enrollments_table = storage.Table('learning-portal-enrollments')
+
+user_cache = create_cache("user-enrollments", USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL)
+# Bumped before every invalidation; a read that started before the bump
+# must not put what it read back into the cache
+user_cache_invalidations = {"count": 0}
+idempotency_store = IdempotencyStore(
+    max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "100000")),
+    ttl=float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+)
 
-class EnrollmentCreate(BaseModel):
-    user_id: str
-    course_id: str
+async def invalidate_user(user_id):
+    user_cache_invalidations["count"] += 1
+    await user_cache.adelete(user_id)
 
 @app.get("/")
 def home():
@@ -25,46 +64,183 @@ def home():
 def health():
     return {"status": "healthy", "service": "enrollment-service"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+@app.get("/cache/stats")
+def cache_stats():
+    return user_cache.stats()
+
+def enrollment_response(item):
+    return {
+        "enrollment_id": item["enrollment_id"],
+        "user_id": item["user_id"],
+        "course_id": item["course_id"],
+        "status": item["status"],
+        "message": "Enrollment created, proceed to payment"
+    }
+
 @app.post("/enrollments/enroll")
-async def enroll(enrollment: EnrollmentCreate):
-    enrollment_id = f"e{secrets.token_hex(8)}"
-    
-    enrollments_table.put_item(
-        Item={
-            "enrollment_id": enrollment_id,
-            "user_id": enrollment.user_id,
-            "course_id": enrollment.course_id,
-            "status": "pending_payment",
-            "created_at": datetime.utcnow().isoformat()
-        }
-    )
+async def enroll(enrollment: EnrollmentCreate, idempotency_key: Optional[str] = Header(None)):
+    fingerprint = request_fingerprint(enrollment.model_dump())
+    write_condition = {}
+    if idempotency_key:
+        try:
+            replay = idempotency_store.lookup(idempotency_key, fingerprint)
+        except IdempotencyConflict:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        if replay is not None:
+            return replay
+        enrollment_id = idempotent_id("e", "enrollments", idempotency_key)
+        write_condition = {"ConditionExpression": "attribute_not_exists(enrollment_id)"}
+    else:
+        enrollment_id = f"e{secrets.token_hex(8)}"
     
-    return {
+    item = {
         "enrollment_id": enrollment_id,
         "user_id": enrollment.user_id,
         "course_id": enrollment.course_id,
         "status": "pending_payment",
-        "message": "Enrollment created, proceed to payment"
+        "created_at": datetime.utcnow().isoformat()
     }
+    try:
+        await run_db(enrollments_table, "put_item", Item=item, **write_condition)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        # Strongly consistent: a duplicate racing the winning write must see it
+        existing = (await run_db(enrollments_table, "get_item", Key={'enrollment_id': enrollment_id}, ConsistentRead=True)).get('Item')
+        if existing is None:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        if existing["user_id"] != enrollment.user_id or existing["course_id"] != enrollment.course_id:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        result = enrollment_response(existing)
+        idempotency_store.remember(idempotency_key, fingerprint, result)
+        return result
+    await invalidate_user(enrollment.user_id)
+    
+    result = enrollment_response(item)
+    if idempotency_key:
+        idempotency_store.remember(idempotency_key, fingerprint, result)
+    return result
 
-@app.get("/enrollments/{user_id}")
-def get_enrollments(user_id: str):
-    response = enrollments_table.query(
-        IndexName='UserIndex',
-        KeyConditionExpression=Key('user_id').eq(user_id)
-    )
+@app.get("/idempotency/stats")
+def idempotency_stats():
+    return idempotency_store.stats()
+
+@app.post("/enrollments/{enrollment_id}/status")
+async def update_enrollment_status(enrollment_id: str, update: EnrollmentStatusUpdate):
+    try:
+        response = await run_db(
+            enrollments_table, "update_item",
+            Key={'enrollment_id': enrollment_id},
+            UpdateExpression="SET #status = :status, updated_at = :updated_at",
+            ConditionExpression="attribute_exists(enrollment_id)",
+            ExpressionAttributeNames={"#status": "status"},
+            ExpressionAttributeValues={
+                ":status": update.status,
+                ":updated_at": datetime.utcnow().isoformat()
+            },
+            ReturnValues="ALL_NEW"
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            raise HTTPException(status_code=404, detail="Enrollment not found")
+        raise
+    await invalidate_user(response["Attributes"]["user_id"])
     
     return {
-        "user_id": user_id,
-        "total": len(response['Items']),
-        "enrollments": response['Items']
+        "enrollment_id": enrollment_id,
+        "status": update.status
     }
 
+def export_filename(fmt):
+    return f"enrollments-{datetime.utcnow():%Y%m%dT%H%M%S}.{fmt}.gz"
+
+@app.get("/enrollments/export")
+def export_enrollments(
+    segments: int = Query(4, ge=1, le=EXPORT_MAX_SEGMENTS),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+):
+    stats = ExportStats(segments)
+    items = parallel_scan(enrollments_table, segments)
+    return StreamingResponse(
+        export_chunks(items, fmt, stats, EXPORT_FIELDS),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(fmt)}"'}
+    )
+
+@app.post("/enrollments/export")
+def export_enrollments_to_file(
+    segments: int = Query(4, ge=1, le=EXPORT_MAX_SEGMENTS),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+):
+    # Writes a file server-side, so it is a POST: nothing may replay it as
+    # a safe read
+    stats = ExportStats(segments)
+    items = parallel_scan(enrollments_table, segments)
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, export_filename(fmt))
+    report = export_to_file(items, path, fmt, stats, EXPORT_FIELDS)
+    return {"status": "exported", "path": path, **report}
+
 @app.get("/enrollments/list")
-def list_enrollments():
-    response = enrollments_table.scan()
+def list_enrollments(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    next_token: Optional[str] = None,
+    stream: bool = False
+):
+    if stream:
+        return StreamingResponse(
+            ndjson_lines(scan_all(enrollments_table)),
+            media_type="application/x-ndjson"
+        )
+    try:
+        enrollments, token = scan_page(enrollments_table, limit or DEFAULT_PAGE_SIZE, next_token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
-        "total": len(response['Items']),
-        "enrollments": response['Items']
+        "total": len(enrollments),
+        "enrollments": enrollments,
+        "next_token": token
     }
 
+@app.get("/enrollments/{user_id}")
+async def get_enrollments(
+    user_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    next_token: Optional[str] = None
+):
+    # Only first pages are cached, one per user: later pages are read far
+    # less often and would make each entry grow without bound
+    cacheable = next_token is None
+    if cacheable:
+        cached = await user_cache.aget(user_id)
+        if cached is not MISSING and cached["limit"] == limit:
+            return cached["page"]
+    invalidations = user_cache_invalidations["count"]
+
+    try:
+        enrollments, token = await run_db(
+            query_page,
+            enrollments_table,
+            limit,
+            next_token,
+            IndexName='UserIndex',
+            KeyConditionExpression=Key('user_id').eq(user_id),
+            ProjectionExpression="enrollment_id, course_id, #status, created_at",
+            ExpressionAttributeNames={"#status": "status"}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    result = {
+        "user_id": user_id,
+        "total": len(enrollments),
+        "enrollments": enrollments,
+        "next_token": token
+    }
+    if cacheable and user_cache_invalidations["count"] == invalidations:
+        await user_cache.aset(user_id, {"limit": limit, "page": result})
+    return result
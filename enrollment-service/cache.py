@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+MISSING = object()
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class LRUCache:
+    """In-process cache bounded by entry count, with per-entry TTL."""
+
+    def __init__(self, max_entries=1024, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return MISSING
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    # Lookups never block, so async callers stay on the event loop
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value):
+        self.set(key, value)
+
+    async def adelete(self, key):
+        self.delete(key)
+
+    async def aclear(self):
+        self.clear()
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+class RedisCache:
+    """Cache shared across replicas through any Redis-compatible server.
+
+    Keys carry a per-namespace generation, so ``clear`` is a single INCR
+    instead of a SCAN over every key; entries of older generations are
+    never read again and lapse with their TTL. redis-py is blocking, so
+    async callers use the ``a*`` methods, which run it in a thread.
+    """
+
+    GET = """
+local generation = redis.call('GET', KEYS[1]) or '0'
+return redis.call('GET', KEYS[1] .. ':' .. generation .. ':' .. ARGV[1])
+"""
+    SET = """
+local generation = redis.call('GET', KEYS[1]) or '0'
+return redis.call('SET', KEYS[1] .. ':' .. generation .. ':' .. ARGV[1], ARGV[2], 'PX', ARGV[3])
+"""
+    DELETE = """
+local generation = redis.call('GET', KEYS[1]) or '0'
+return redis.call('DEL', KEYS[1] .. ':' .. generation .. ':' .. ARGV[1])
+"""
+
+    def __init__(self, url, namespace, ttl=30.0):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.namespace = namespace
+        self.ttl = ttl
+        self.generation_key = f"{namespace}:generation"
+        self._get = self.client.register_script(self.GET)
+        self._set = self.client.register_script(self.SET)
+        self._delete = self.client.register_script(self.DELETE)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        raw = self._get(keys=[self.generation_key], args=[key])
+        if raw is None:
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value):
+        raw = json.dumps(value, default=_json_default)
+        self._set(keys=[self.generation_key], args=[key, raw, int(self.ttl * 1000)])
+
+    def delete(self, key):
+        self._delete(keys=[self.generation_key], args=[key])
+
+    def clear(self):
+        self.client.incr(self.generation_key)
+
+    async def aget(self, key):
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key, value):
+        await asyncio.to_thread(self.set, key, value)
+
+    async def adelete(self, key):
+        await asyncio.to_thread(self.delete, key)
+
+    async def aclear(self):
+        await asyncio.to_thread(self.clear)
+
+    def stats(self):
+        return {
+            "backend": "redis",
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": 0
+        }
+
+def create_cache(namespace, max_entries=1024, ttl=30.0):
+    backend = os.getenv("CACHE_BACKEND", "memory")
+    if backend == "redis":
+        return RedisCache(os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"), namespace, ttl)
+    if backend != "memory":
+        raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+    return LRUCache(max_entries, ttl)
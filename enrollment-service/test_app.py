@@ -19,3 +19,135 @@ def test_enroll_missing_fields():
     response = client.post("/enrollments/enroll", json={})
     assert response.status_code == 422
 
+
+def test_list_enrollments_invalid_limit():
+    response = client.get("/enrollments/list", params={"limit": 0})
+    assert response.status_code == 422
+
+def test_list_enrollments_invalid_next_token():
+    response = client.get("/enrollments/list", params={"limit": 10, "next_token": "not-a-token"})
+    assert response.status_code == 400
+
+class FakeEnrollmentsTable:
+    def __init__(self):
+        self.items = []
+        self.queries = []
+
+    def put_item(self, Item):
+        self.items.append(Item)
+
+    def update_item(self, Key, ExpressionAttributeValues, **kwargs):
+        from botocore.exceptions import ClientError
+        for item in self.items:
+            if item["enrollment_id"] == Key["enrollment_id"]:
+                item["status"] = ExpressionAttributeValues[":status"]
+                return {"Attributes": item}
+        raise ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem")
+
+    def query(self, **kwargs):
+        self.queries.append(kwargs)
+        user_id = kwargs["KeyConditionExpression"].get_expression()["values"][1]
+        mine = [i for i in self.items if i["user_id"] == user_id]
+        start = int(kwargs["ExclusiveStartKey"]["offset"]) if "ExclusiveStartKey" in kwargs else 0
+        page = mine[start:start + kwargs["Limit"]]
+        response = {"Items": [{k: v for k, v in i.items() if k != "user_id"} for i in page]}
+        if start + kwargs["Limit"] < len(mine):
+            response["LastEvaluatedKey"] = {"offset": str(start + kwargs["Limit"])}
+        return response
+
+def test_get_enrollments_paginates_caches_and_invalidates(monkeypatch):
+    import app as enrollment_app
+    table = FakeEnrollmentsTable()
+    monkeypatch.setattr(enrollment_app, "enrollments_table", table)
+    enrollment_app.user_cache.clear()
+    for course_id in ("c1", "c2", "c3"):
+        client.post("/enrollments/enroll", json={"user_id": "u1", "course_id": course_id})
+
+    first = client.get("/enrollments/u1", params={"limit": 2}).json()
+    assert len(first["enrollments"]) == 2
+    assert "ExclusiveStartKey" not in table.queries[0]
+    assert "#status" in table.queries[0]["ProjectionExpression"]
+    second = client.get("/enrollments/u1", params={"limit": 2, "next_token": first["next_token"]}).json()
+    assert len(second["enrollments"]) == 1
+    assert second["next_token"] is None
+
+    client.get("/enrollments/u1", params={"limit": 2})
+    assert len(table.queries) == 2
+
+    client.post("/enrollments/enroll", json={"user_id": "u1", "course_id": "c4"})
+    client.get("/enrollments/u1", params={"limit": 2})
+    assert len(table.queries) == 3
+
+def test_get_enrollments_skips_cache_fill_invalidated_mid_query(monkeypatch):
+    import asyncio
+    import app as enrollment_app
+    table = FakeEnrollmentsTable()
+    monkeypatch.setattr(enrollment_app, "enrollments_table", table)
+    enrollment_app.user_cache.clear()
+    client.post("/enrollments/enroll", json={"user_id": "u1", "course_id": "c1"})
+    query = table.query
+
+    def query_racing_an_enroll(**kwargs):
+        response = query(**kwargs)
+        # An enroll lands after this read but before it is cached
+        table.items.append({"enrollment_id": "e2", "user_id": "u1", "course_id": "c2", "status": "pending_payment"})
+        asyncio.run(enrollment_app.invalidate_user("u1"))
+        return response
+
+    monkeypatch.setattr(table, "query", query_racing_an_enroll)
+    assert client.get("/enrollments/u1").json()["total"] == 1
+    monkeypatch.setattr(table, "query", query)
+    assert client.get("/enrollments/u1").json()["total"] == 2
+
+    # Later pages are never cached
+    first = client.get("/enrollments/u1", params={"limit": 1}).json()
+    client.get("/enrollments/u1", params={"limit": 1, "next_token": first["next_token"]})
+    client.get("/enrollments/u1", params={"limit": 1, "next_token": first["next_token"]})
+    assert len(table.queries) == 5
+
+def test_update_enrollment_status(monkeypatch):
+    import app as enrollment_app
+    table = FakeEnrollmentsTable()
+    monkeypatch.setattr(enrollment_app, "enrollments_table", table)
+    enrollment_id = client.post("/enrollments/enroll", json={"user_id": "u1", "course_id": "c1"}).json()["enrollment_id"]
+    response = client.post(f"/enrollments/{enrollment_id}/status", json={"status": "paid"})
+    assert response.status_code == 200
+    assert table.items[0]["status"] == "paid"
+    assert client.post("/enrollments/missing/status", json={"status": "paid"}).status_code == 404
+    assert client.post(f"/enrollments/{enrollment_id}/status", json={"status": "refunded"}).status_code == 422
+
+def test_enrollments_on_memory_engine(monkeypatch):
+    import app as enrollment_app
+    from storage import MemoryEngine
+    table = MemoryEngine().Table("learning-portal-enrollments")
+    monkeypatch.setattr(enrollment_app, "enrollments_table", table)
+    enrollment_app.user_cache.clear()
+    ids = [client.post("/enrollments/enroll", json={"user_id": "u1", "course_id": c}).json()["enrollment_id"] for c in ("c1", "c2", "c3")]
+    client.post("/enrollments/enroll", json={"user_id": "u2", "course_id": "c1"})
+
+    first = client.get("/enrollments/u1", params={"limit": 2}).json()
+    second = client.get("/enrollments/u1", params={"limit": 2, "next_token": first["next_token"]}).json()
+    assert [e["enrollment_id"] for e in first["enrollments"] + second["enrollments"]] == ids
+    assert set(first["enrollments"][0]) == {"enrollment_id", "course_id", "status", "created_at"}
+    assert second["next_token"] is None
+
+    assert client.post(f"/enrollments/{ids[0]}/status", json={"status": "paid"}).json()["status"] == "paid"
+    assert client.post("/enrollments/missing/status", json={"status": "paid"}).status_code == 404
+    assert "missing" not in table.records
+
+def test_memory_engine_segmented_scan_and_snapshot(tmp_path):
+    from dynamo import parallel_scan, scan_page
+    from storage import MemoryEngine
+    path = str(tmp_path / "snapshot.json")
+    engine = MemoryEngine(snapshot_path=path)
+    table = engine.Table("learning-portal-enrollments")
+    for i in range(25):
+        table.put_item(Item={"enrollment_id": f"e{i}", "user_id": f"u{i % 3}", "status": "pending_payment", "note": i})
+    assert sorted(item["enrollment_id"] for item in parallel_scan(table, 4)) == sorted(f"e{i}" for i in range(25))
+    page, token = scan_page(table, 10)
+    assert len(page) == 10 and token is not None
+
+    engine.save(path)
+    restored = MemoryEngine(snapshot_path=path).Table("learning-portal-enrollments")
+    assert restored.get_item(Key={"enrollment_id": "e7"})["Item"]["note"] == 7
+    assert len(restored.indexes["UserIndex"]["u1"]) == 8
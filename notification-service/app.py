@@ -1,18 +1,76 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from typing import Optional
 from datetime import datetime
+import json
 import secrets
-import boto3
+from dynamo import BOTO_CONFIG, run_db, scan_page, scan_all, ndjson_lines
+from storage import connect_in_background, create_storage
+from models import EmailNotification
+from metrics import MetricsMiddleware, instrument_dynamodb, metrics_response
+from tracing import TracingMiddleware, create_tracer, trace_dynamodb
 
-app = FastAPI(title="Notification Service", version="1.0.0")
+tracer = create_tracer("notification-service")
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-2')
-notifications_table = dynamodb.Table('learning-portal-notifications')
+@asynccontextmanager
+async def lifespan(app):
+    app.state.startup_tasks = [connect_in_background(storage)]
+    yield
+    for task in app.state.startup_tasks:
+        task.cancel()
 
-class EmailNotification(BaseModel):
-    user_email: str
-    subject: str
-    body: str
+app = FastAPI(title="Notification Service", version="1.0.0", lifespan=lifespan)
+app.add_middleware(TracingMiddleware, tracer=tracer)
+app.add_middleware(MetricsMiddleware)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+BATCH_CHUNK_SIZE = 25
+
+storage = create_storage(BOTO_CONFIG)
+storage.instrument(instrument_dynamodb)
+storage.instrument(trace_dynamodb, tracer)
+notifications_table = storage.Table('learning-portal-notifications')
+
+def email_item(notification_id, notification):
+    return {
+        "notification_id": notification_id,
+        "user_email": notification.user_email,
+        "subject": notification.subject,
+        "body": notification.body,
+        "status": "sent",
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+def write_batch(items):
+    # batch_writer sends BatchWriteItem requests of up to 25 items and
+    # resubmits anything DynamoDB returns as UnprocessedItems
+    with notifications_table.batch_writer() as batch:
+        for item in items:
+            batch.put_item(Item=item)
+
+async def batch_entries(request):
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+        return
+    try:
+        entries = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON list or NDJSON")
+    if not isinstance(entries, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON list or NDJSON")
+    for entry in entries:
+        yield entry
 
 @app.get("/")
 def home():
@@ -22,20 +80,15 @@ def home():
 def health():
     return {"status": "healthy", "service": "notification-service"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
 @app.post("/notify/email")
-def send_email(notification: EmailNotification):
+async def send_email(notification: EmailNotification):
     notification_id = f"n{secrets.token_hex(8)}"
     
-    notifications_table.put_item(
-        Item={
-            "notification_id": notification_id,
-            "user_email": notification.user_email,
-            "subject": notification.subject,
-            "body": notification.body,
-            "status": "sent",
-            "timestamp": datetime.utcnow().isoformat()
-        }
-    )
+    await run_db(notifications_table, "put_item", Item=email_item(notification_id, notification))
     
     return {
         "message": f"Notification sent to {notification.user_email}",
@@ -43,11 +96,50 @@ def send_email(notification: EmailNotification):
         "status": "sent"
     }
 
+@app.post("/notify/email/batch")
+async def send_email_batch(request: Request):
+    results = []
+    chunk = []
+
+    async def flush():
+        try:
+            await run_db(write_batch, [item for _, item in chunk])
+            results.extend({"index": i, "notification_id": item["notification_id"], "status": "sent"} for i, item in chunk)
+        except Exception as e:
+            results.extend({"index": i, "status": "failed", "error": str(e)} for i, _ in chunk)
+        chunk.clear()
+
+    index = 0
+    async for entry in batch_entries(request):
+        try:
+            if isinstance(entry, bytes):
+                entry = json.loads(entry)
+            notification = EmailNotification(**entry)
+        except (ValueError, TypeError, ValidationError) as e:
+            results.append({"index": index, "status": "invalid", "error": str(e)})
+        else:
+            chunk.append((index, email_item(f"n{secrets.token_hex(8)}", notification)))
+            if len(chunk) == BATCH_CHUNK_SIZE:
+                await flush()
+        index += 1
+    if chunk:
+        await flush()
+
+    results.sort(key=lambda r: r["index"])
+    sent = sum(1 for r in results if r["status"] == "sent")
+    return {
+        "total": len(results),
+        "sent": sent,
+        "failed": len(results) - sent,
+        "results": results
+    }
+
 @app.post("/notify/success")
-def send_success_notification(data: dict):
+async def send_success_notification(data: dict):
     notification_id = f"n{secrets.token_hex(8)}"
     
-    notifications_table.put_item(
+    await run_db(
+        notifications_table, "put_item",
         Item={
             "notification_id": notification_id,
             "type": "success",
@@ -64,10 +156,22 @@ def send_success_notification(data: dict):
     }
 
 @app.get("/notifications/list")
-def list_notifications():
-    response = notifications_table.scan()
+def list_notifications(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    next_token: Optional[str] = None,
+    stream: bool = False
+):
+    if stream:
+        return StreamingResponse(
+            ndjson_lines(scan_all(notifications_table)),
+            media_type="application/x-ndjson"
+        )
+    try:
+        notifications, token = scan_page(notifications_table, limit or DEFAULT_PAGE_SIZE, next_token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
-        "total": len(response['Items']),
-        "notifications": response['Items']
+        "total": len(notifications),
+        "notifications": notifications,
+        "next_token": token
     }
-
@@ -19,3 +19,59 @@ def test_email_notification_missing_fields():
     response = client.post("/notify/email", json={})
     assert response.status_code == 422
 
+def test_list_notifications_invalid_limit():
+    response = client.get("/notifications/list", params={"limit": 0})
+    assert response.status_code == 422
+
+def test_list_notifications_invalid_next_token():
+    response = client.get("/notifications/list", params={"limit": 10, "next_token": "not-a-token"})
+    assert response.status_code == 400
+
+class FakeBatchTable:
+    def __init__(self):
+        self.items = []
+        self.batches = 0
+
+    def batch_writer(self):
+        table = self
+
+        class Writer:
+            def __enter__(self):
+                table.batches += 1
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def put_item(self, Item):
+                table.items.append(Item)
+
+        return Writer()
+
+def test_send_email_batch_json_list(monkeypatch):
+    import app as notification_app
+    table = FakeBatchTable()
+    monkeypatch.setattr(notification_app, "notifications_table", table)
+    notifications = [{"user_email": f"u{i}@test.com", "subject": "Launch", "body": "New course"} for i in range(30)]
+    notifications.insert(3, {"user_email": "bad@test.com"})
+    response = client.post("/notify/email/batch", json=notifications)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["sent"] == 30
+    assert body["results"][3]["status"] == "invalid"
+    assert all(r["notification_id"].startswith("n") for r in body["results"] if r["status"] == "sent")
+    assert len(table.items) == 30
+    assert table.batches == 2
+
+def test_send_email_batch_ndjson(monkeypatch):
+    import json
+    import app as notification_app
+    table = FakeBatchTable()
+    monkeypatch.setattr(notification_app, "notifications_table", table)
+    lines = "\n".join(json.dumps({"user_email": f"u{i}@test.com", "subject": "s", "body": "b"}) for i in range(3))
+    response = client.post("/notify/email/batch", content=lines, headers={"content-type": "application/x-ndjson"})
+    assert response.json()["sent"] == 3
+
+def test_send_email_batch_rejects_object():
+    response = client.post("/notify/email/batch", json={"user_email": "a@test.com"})
+    assert response.status_code == 400
@@ -1,22 +1,78 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Header
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import asyncio
 import httpx
+import os
 import secrets
-import boto3
+from botocore.exceptions import ClientError
 from datetime import datetime
+from outbox import NotificationOutbox
+from idempotency import IdempotencyStore, IdempotencyConflict, idempotent_id, request_fingerprint
+from dynamo import BOTO_CONFIG, run_db, scan_page, scan_all, ndjson_lines, parallel_scan, export_chunks, export_to_file, ExportStats
+from storage import connect_in_background, create_storage
+from models import PaymentInitiate
+from metrics import MetricsMiddleware, MetricsTransport, instrument_dynamodb, metrics_response
+from tracing import TracingMiddleware, TracingTransport, create_tracer, current_traceparent, parse_traceparent, trace_dynamodb
 
-app = FastAPI(title="Payment Service", version="1.0.0")
+NOTIFICATION_SERVICE_URL = os.getenv("NOTIFICATION_SERVICE_URL", "http://notification-service.learning-portal.local:8080")
 
-NOTIFICATION_SERVICE_URL = "http://notification-service.learning-portal.local:8080"
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_DIR = os.getenv("EXPORT_DIR", "/tmp/exports")
+EXPORT_MAX_SEGMENTS = 64
+EXPORT_FIELDS = ["payment_id", "enrollment_id", "amount", "method", "status", "created_at"]
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-2')
-payments_table = dynamodb.Table('learning-portal-payments')
+tracer = create_tracer("payment-service")
 
-class PaymentInitiate(BaseModel):
-    enrollment_id: str
-    amount: float
-    method: str = "card"
-    user_email: str = ""
+storage = create_storage(BOTO_CONFIG)
+storage.instrument(instrument_dynamodb)
+storage.instrument(trace_dynamodb, tracer)
+payments_table = storage.Table('learning-portal-payments')
+
+outbox = NotificationOutbox(
+    os.getenv("OUTBOX_PATH", "/tmp/payment-outbox.db"),
+    capacity=int(os.getenv("OUTBOX_CAPACITY", "10000")),
+    batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", "25")),
+    max_attempts=int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+)
+notification_client = None
+idempotency_store = IdempotencyStore(
+    max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "100000")),
+    ttl=float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+)
+
+async def send_notification(payload):
+    # The outbox worker runs outside any request, so resume the trace of
+    # the payment that queued this notification
+    payload = dict(payload)
+    parent = parse_traceparent(payload.pop("traceparent", None))
+    with tracer.span("outbox.deliver", parent=parent):
+        response = await notification_client.post(f"{NOTIFICATION_SERVICE_URL}/notify/email", json=payload)
+        response.raise_for_status()
+
+@asynccontextmanager
+async def lifespan(app):
+    global notification_client
+    app.state.startup_tasks = [connect_in_background(storage)]
+    notification_client = httpx.AsyncClient(
+        timeout=5.0,
+        transport=TracingTransport(
+            MetricsTransport(httpx.AsyncHTTPTransport(), "notification-service"),
+            "notification-service", tracer
+        )
+    )
+    worker = asyncio.create_task(outbox.run(send_notification))
+    yield
+    for task in app.state.startup_tasks:
+        task.cancel()
+    worker.cancel()
+    await notification_client.aclose()
+
+app = FastAPI(title="Payment Service", version="1.0.0", lifespan=lifespan)
+app.add_middleware(TracingMiddleware, tracer=tracer)
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/")
 def home():
@@ -26,56 +82,135 @@ def home():
 def health():
     return {"status": "healthy", "service": "payment-service"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+def payment_response(item):
+    return {
+        "payment_id": item["payment_id"],
+        "enrollment_id": item["enrollment_id"],
+        "status": item["status"],
+        "amount": float(item["amount"])
+    }
+
 @app.post("/payments/initiate")
-async def initiate_payment(payment: PaymentInitiate):
-    payment_id = f"p{secrets.token_hex(8)}"
-    
-    payments_table.put_item(
-        Item={
-            "payment_id": payment_id,
-            "enrollment_id": payment.enrollment_id,
-            "amount": str(payment.amount),
-            "method": payment.method,
-            "status": "success",
-            "created_at": datetime.utcnow().isoformat()
-        }
-    )
-    
-    if payment.user_email:
+async def initiate_payment(payment: PaymentInitiate, idempotency_key: Optional[str] = Header(None)):
+    fingerprint = request_fingerprint(payment.model_dump())
+    write_condition = {}
+    if idempotency_key:
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                await client.post(
-                    f"{NOTIFICATION_SERVICE_URL}/notify/email",
-                    json={
-                        "user_email": payment.user_email,
-                        "subject": "Payment Successful",
-                        "body": f"Your payment of ${payment.amount} was successful"
-                    }
-                )
-        except Exception:
-            pass
+            replay = idempotency_store.lookup(idempotency_key, fingerprint)
+        except IdempotencyConflict:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        if replay is not None:
+            return replay
+        payment_id = idempotent_id("p", "payments", idempotency_key)
+        write_condition = {"ConditionExpression": "attribute_not_exists(payment_id)"}
+    else:
+        payment_id = f"p{secrets.token_hex(8)}"
     
-    return {
+    item = {
         "payment_id": payment_id,
         "enrollment_id": payment.enrollment_id,
+        "amount": str(payment.amount),
+        "method": payment.method,
         "status": "success",
-        "amount": payment.amount
+        "created_at": datetime.utcnow().isoformat()
     }
+    try:
+        await run_db(payments_table, "put_item", Item=item, **write_condition)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        # A previous attempt with this key already charged: replay it
+        # Strongly consistent: a duplicate racing the winning write must see it
+        existing = (await run_db(payments_table, "get_item", Key={'payment_id': payment_id}, ConsistentRead=True)).get('Item')
+        if existing is None:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        if existing["enrollment_id"] != payment.enrollment_id or existing["amount"] != str(payment.amount):
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        result = payment_response(existing)
+        idempotency_store.remember(idempotency_key, fingerprint, result)
+        return result
+    
+    if payment.user_email:
+        await outbox.aenqueue({
+            "user_email": payment.user_email,
+            "subject": "Payment Successful",
+            "body": f"Your payment of ${payment.amount} was successful",
+            "traceparent": current_traceparent()
+        })
+    
+    result = payment_response(item)
+    if idempotency_key:
+        idempotency_store.remember(idempotency_key, fingerprint, result)
+    return result
+
+@app.get("/idempotency/stats")
+def idempotency_stats():
+    return idempotency_store.stats()
+
+@app.get("/outbox/stats")
+def outbox_stats():
+    return outbox.stats()
 
 @app.get("/payments/status/{payment_id}")
-def get_payment_status(payment_id: str):
-    response = payments_table.get_item(Key={'payment_id': payment_id})
+async def get_payment_status(payment_id: str):
+    response = await run_db(payments_table, "get_item", Key={'payment_id': payment_id})
     
     if 'Item' not in response:
         raise HTTPException(status_code=404, detail="Payment not found")
     
     return response['Item']
 
+def export_filename(fmt):
+    return f"payments-{datetime.utcnow():%Y%m%dT%H%M%S}.{fmt}.gz"
+
+@app.get("/payments/export")
+def export_payments(
+    segments: int = Query(4, ge=1, le=EXPORT_MAX_SEGMENTS),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+):
+    stats = ExportStats(segments)
+    items = parallel_scan(payments_table, segments)
+    return StreamingResponse(
+        export_chunks(items, fmt, stats, EXPORT_FIELDS),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(fmt)}"'}
+    )
+
+@app.post("/payments/export")
+def export_payments_to_file(
+    segments: int = Query(4, ge=1, le=EXPORT_MAX_SEGMENTS),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+):
+    # Writes a file server-side, so it is a POST: nothing may replay it as
+    # a safe read
+    stats = ExportStats(segments)
+    items = parallel_scan(payments_table, segments)
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, export_filename(fmt))
+    report = export_to_file(items, path, fmt, stats, EXPORT_FIELDS)
+    return {"status": "exported", "path": path, **report}
+
 @app.get("/payments/list")
-def list_payments():
-    response = payments_table.scan()
+def list_payments(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    next_token: Optional[str] = None,
+    stream: bool = False
+):
+    if stream:
+        return StreamingResponse(
+            ndjson_lines(scan_all(payments_table)),
+            media_type="application/x-ndjson"
+        )
+    try:
+        payments, token = scan_page(payments_table, limit or DEFAULT_PAGE_SIZE, next_token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
-        "total": len(response['Items']),
-        "payments": response['Items']
+        "total": len(payments),
+        "payments": payments,
+        "next_token": token
     }
-
@@ -0,0 +1,40 @@
+import hashlib
+import json
+from cache import LRUCache, MISSING
+
+class IdempotencyConflict(Exception):
+    pass
+
+def request_fingerprint(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def idempotent_id(prefix, scope, key):
+    # Same key, same id: a replayed request targets the record the first
+    # attempt wrote, which the conditional put then refuses to overwrite
+    return prefix + hashlib.sha256(f"{scope}:{key}".encode()).hexdigest()[:16]
+
+class IdempotencyStore:
+    """In-memory front for recent Idempotency-Key responses.
+
+    The durable guarantee comes from conditional writes on the record id;
+    this only saves the write attempt and read-back for recent replays.
+    """
+
+    def __init__(self, max_entries=100000, ttl=86400.0):
+        self.responses = LRUCache(max_entries, ttl)
+        self.replays = 0
+
+    def lookup(self, key, fingerprint):
+        entry = self.responses.get(key)
+        if entry is MISSING:
+            return None
+        if entry[0] != fingerprint:
+            raise IdempotencyConflict(key)
+        self.replays += 1
+        return entry[1]
+
+    def remember(self, key, fingerprint, response):
+        self.responses.set(key, (fingerprint, response))
+
+    def stats(self):
+        return dict(self.responses.stats(), replays=self.replays)
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class NotificationOutbox:
+    """Bounded, SQLite-backed queue of notifications waiting to be delivered.
+
+    Rows survive a restart when ``path`` is a file; ``":memory:"`` keeps the
+    queue in process only. Several server workers can share one file: each
+    drain leases its batch for ``lease`` seconds, so a row is sent by one
+    worker at a time and is retried if that worker dies mid-send.
+    """
+
+    def __init__(self, path, capacity=10000, batch_size=25, max_attempts=5, backoff=0.5, poll_interval=1.0, lease=30.0):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "payload TEXT NOT NULL, "
+            "enqueued_at REAL NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_attempt REAL NOT NULL)"
+        )
+        self.wakeup = asyncio.Event()
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+        self.dead = 0
+
+    def enqueue(self, payload):
+        if not self._insert(payload):
+            return False
+        self.wakeup.set()
+        return True
+
+    async def aenqueue(self, payload):
+        # The SQLite write (and its fsync) runs in a thread; the wakeup is
+        # an asyncio.Event, so it is set back on the loop
+        if not await asyncio.to_thread(self._insert, payload):
+            return False
+        self.wakeup.set()
+        return True
+
+    def _insert(self, payload):
+        now = time.time()
+        with self.lock:
+            if self._depth() >= self.capacity:
+                self.dropped += 1
+                logger.warning("notification outbox full, dropping notification")
+                return False
+            self.db.execute(
+                "INSERT INTO outbox (payload, enqueued_at, next_attempt) VALUES (?, ?, ?)",
+                (json.dumps(payload), now, now)
+            )
+        return True
+
+    def _depth(self):
+        return self.db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def _claim(self):
+        now = time.time()
+        with self.lock:
+            # IMMEDIATE takes the write lock up front, so no other worker can
+            # select the same rows between our SELECT and the lease UPDATE
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.db.execute(
+                    "SELECT id, payload, attempts FROM outbox WHERE next_attempt <= ? ORDER BY id LIMIT ?",
+                    (now, self.batch_size)
+                ).fetchall()
+                self.db.executemany(
+                    "UPDATE outbox SET next_attempt = ? WHERE id = ?",
+                    [(now + self.lease, row_id) for row_id, _, _ in rows]
+                )
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return [(row_id, json.loads(payload), attempts) for row_id, payload, attempts in rows]
+
+    def _complete(self, delivered, failed):
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.executemany("DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id in delivered])
+            for row_id, attempts in failed:
+                if attempts + 1 >= self.max_attempts:
+                    self.db.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                    self.dead += 1
+                else:
+                    self.db.execute(
+                        "UPDATE outbox SET attempts = ?, next_attempt = ? WHERE id = ?",
+                        (attempts + 1, now + self.backoff * 2 ** attempts, row_id)
+                    )
+                    self.retried += 1
+            self.db.execute("COMMIT")
+        self.sent += len(delivered)
+
+    async def drain_once(self, send):
+        batch = await asyncio.to_thread(self._claim)
+        if not batch:
+            return 0
+        results = await asyncio.gather(*(send(payload) for _, payload, _ in batch), return_exceptions=True)
+        delivered = []
+        failed = []
+        for (row_id, _, attempts), result in zip(batch, results):
+            if isinstance(result, Exception):
+                failed.append((row_id, attempts))
+            else:
+                delivered.append(row_id)
+        await asyncio.to_thread(self._complete, delivered, failed)
+        return len(batch)
+
+    async def run(self, send):
+        while True:
+            try:
+                if await self.drain_once(send):
+                    continue
+            except Exception:
+                logger.exception("notification outbox drain failed")
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            depth, oldest = self.db.execute("SELECT COUNT(*), MIN(enqueued_at) FROM outbox").fetchone()
+        return {
+            "depth": depth,
+            "capacity": self.capacity,
+            "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "sent": self.sent,
+            "retried": self.retried,
+            "dead": self.dead,
+            "dropped": self.dropped
+        }
+
+    def close(self):
+        with self.lock:
+            self.db.close()
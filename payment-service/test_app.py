@@ -23,3 +23,240 @@ def test_get_nonexistent_payment():
     response = client.get("/payments/status/nonexistent-id")
     assert response.status_code == 404
 
+def test_list_payments_invalid_limit():
+    response = client.get("/payments/list", params={"limit": 0})
+    assert response.status_code == 422
+
+def test_list_payments_invalid_next_token():
+    response = client.get("/payments/list", params={"limit": 10, "next_token": "not-a-token"})
+    assert response.status_code == 400
+
+class FakeSegmentedTable:
+    def __init__(self, count):
+        self.items = [{"payment_id": f"p{i}", "amount": "10.0", "status": "success"} for i in range(count)]
+
+    def scan(self, Segment, TotalSegments, ExclusiveStartKey=None):
+        segment = [item for i, item in enumerate(self.items) if i % TotalSegments == Segment]
+        start = ExclusiveStartKey["offset"] if ExclusiveStartKey else 0
+        response = {"Items": segment[start:start + 2]}
+        if start + 2 < len(segment):
+            response["LastEvaluatedKey"] = {"offset": start + 2}
+        return response
+
+def test_export_payments_parallel_scan(monkeypatch):
+    import gzip
+    import json
+    import app as payment_app
+    monkeypatch.setattr(payment_app, "payments_table", FakeSegmentedTable(11))
+    response = client.get("/payments/export", params={"segments": 3})
+    assert response.status_code == 200
+    lines = gzip.decompress(response.content).decode().splitlines()
+    assert sorted(json.loads(line)["payment_id"] for line in lines) == sorted(f"p{i}" for i in range(11))
+
+def test_export_payments_to_file(monkeypatch, tmp_path):
+    import app as payment_app
+    monkeypatch.setattr(payment_app, "payments_table", FakeSegmentedTable(5))
+    monkeypatch.setattr(payment_app, "EXPORT_DIR", str(tmp_path))
+    response = client.post("/payments/export", params={"segments": 2, "format": "csv"})
+    assert response.status_code == 200
+    assert response.json()["items"] == 5
+    assert response.json()["segments"] == 2
+
+def test_export_payments_invalid_format():
+    response = client.get("/payments/export", params={"format": "xml"})
+    assert response.status_code == 422
+
+def test_outbox_delivers_and_retries():
+    import asyncio
+    from outbox import NotificationOutbox
+    outbox = NotificationOutbox(":memory:", backoff=0)
+    outbox.enqueue({"user_email": "a@test.com"})
+    outbox.enqueue({"user_email": "b@test.com"})
+    delivered = []
+    failures = {"b@test.com": 1}
+
+    async def flaky_send(payload):
+        if failures.get(payload["user_email"]):
+            failures[payload["user_email"]] -= 1
+            raise RuntimeError("notification-service down")
+        delivered.append(payload["user_email"])
+
+    asyncio.run(outbox.drain_once(flaky_send))
+    assert outbox.stats()["depth"] == 1
+    assert outbox.stats()["retried"] == 1
+    asyncio.run(outbox.drain_once(flaky_send))
+    assert delivered == ["a@test.com", "b@test.com"]
+    assert outbox.stats()["depth"] == 0
+    assert outbox.stats()["sent"] == 2
+
+def test_outbox_bounded_capacity():
+    from outbox import NotificationOutbox
+    outbox = NotificationOutbox(":memory:", capacity=1)
+    assert outbox.enqueue({"user_email": "a@test.com"})
+    assert not outbox.enqueue({"user_email": "b@test.com"})
+    assert outbox.stats()["dropped"] == 1
+
+def test_outbox_workers_sharing_a_file_claim_disjoint_rows(tmp_path):
+    from outbox import NotificationOutbox
+    path = str(tmp_path / "outbox.db")
+    first = NotificationOutbox(path, batch_size=1, lease=60)
+    second = NotificationOutbox(path, batch_size=1, lease=60)
+    first.enqueue({"user_email": "a@test.com"})
+    first.enqueue({"user_email": "b@test.com"})
+    [(_, claimed_first, _)] = first._claim()
+    [(_, claimed_second, _)] = second._claim()
+    assert {claimed_first["user_email"], claimed_second["user_email"]} == {"a@test.com", "b@test.com"}
+    assert first._claim() == [] and second._claim() == []
+    first.close()
+    second.close()
+
+class FakeConditionalTable:
+    def __init__(self):
+        self.items = {}
+        self.puts = 0
+
+    def put_item(self, Item, ConditionExpression=None):
+        from botocore.exceptions import ClientError
+        self.puts += 1
+        if ConditionExpression and Item["payment_id"] in self.items:
+            raise ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem")
+        self.items[Item["payment_id"]] = Item
+
+    def get_item(self, Key, ConsistentRead=False):
+        assert ConsistentRead
+        item = self.items.get(Key["payment_id"])
+        return {"Item": item} if item else {}
+
+def test_initiate_payment_idempotency_key(monkeypatch):
+    import app as payment_app
+    from idempotency import IdempotencyStore
+    from outbox import NotificationOutbox
+    table = FakeConditionalTable()
+    monkeypatch.setattr(payment_app, "payments_table", table)
+    monkeypatch.setattr(payment_app, "outbox", NotificationOutbox(":memory:"))
+    monkeypatch.setattr(payment_app, "idempotency_store", IdempotencyStore())
+    body = {"enrollment_id": "e1", "amount": 10.0, "user_email": "a@test.com"}
+    headers = {"Idempotency-Key": "retry-1"}
+
+    first = client.post("/payments/initiate", json=body, headers=headers).json()
+    second = client.post("/payments/initiate", json=body, headers=headers).json()
+    assert first == second
+    assert table.puts == 1
+
+    # A replica without the in-memory entry relies on the conditional write
+    monkeypatch.setattr(payment_app, "idempotency_store", IdempotencyStore())
+    third = client.post("/payments/initiate", json=body, headers=headers).json()
+    assert third == first
+    assert len(table.items) == 1
+    assert payment_app.outbox.stats()["depth"] == 1
+
+    conflict = client.post("/payments/initiate", json=dict(body, amount=99.0), headers=headers)
+    assert conflict.status_code == 422
+
+def test_initiate_payment_conflicting_write_not_yet_visible(monkeypatch):
+    import app as payment_app
+    from idempotency import IdempotencyStore
+    from outbox import NotificationOutbox
+    table = FakeConditionalTable()
+    monkeypatch.setattr(payment_app, "payments_table", table)
+    monkeypatch.setattr(payment_app, "outbox", NotificationOutbox(":memory:"))
+    monkeypatch.setattr(payment_app, "idempotency_store", IdempotencyStore())
+    body = {"enrollment_id": "e1", "amount": 10.0, "user_email": "a@test.com"}
+    client.post("/payments/initiate", json=body, headers={"Idempotency-Key": "racing"})
+    # The duplicate's conditional write fails but its read misses the winner
+    monkeypatch.setattr(table, "get_item", lambda Key, ConsistentRead=False: {})
+    monkeypatch.setattr(payment_app, "idempotency_store", IdempotencyStore())
+    response = client.post("/payments/initiate", json=body, headers={"Idempotency-Key": "racing"})
+    assert response.status_code == 409
+
+def test_outbound_http_calls_are_timed():
+    import asyncio
+    import httpx
+    from metrics import Metrics, MetricsTransport
+    metrics = Metrics()
+
+    def handler(request):
+        if request.url.path == "/unreachable":
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(503 if request.url.path == "/down" else 200)
+
+    async def call():
+        transport = MetricsTransport(httpx.MockTransport(handler), "notification-service", metrics)
+        async with httpx.AsyncClient(transport=transport) as http:
+            await http.post("http://notify/notify/email", json={})
+            await http.post("http://notify/down", json={})
+            with pytest.raises(httpx.ConnectError):
+                await http.post("http://notify/unreachable", json={})
+
+    asyncio.run(call())
+    assert metrics.dependency_calls == {
+        ("notification-service", "POST", "ok"): 1,
+        ("notification-service", "POST", "error"): 2
+    }
+
+def test_metrics_endpoint():
+    client.get("/health")
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/health",status="200"}' in response.text
+    assert "http_requests_in_flight 1" in response.text
+
+def test_trace_context_propagates_to_notification(monkeypatch):
+    import asyncio
+    import httpx
+    import app as payment_app
+    from outbox import NotificationOutbox
+    from tracing import MemoryExporter, TracingTransport
+    exporter = MemoryExporter()
+    monkeypatch.setattr(payment_app.tracer, "exporter", exporter)
+    monkeypatch.setattr(payment_app, "payments_table", FakeConditionalTable())
+    monkeypatch.setattr(payment_app, "outbox", NotificationOutbox(":memory:"))
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    incoming = f"00-{trace_id}-00f067aa0ba902b7-01"
+
+    body = {"enrollment_id": "e1", "amount": 10.0, "user_email": "a@test.com"}
+    assert client.post("/payments/initiate", json=body, headers={"traceparent": incoming}).status_code == 200
+    server_span = exporter.spans[-1]
+    assert server_span["name"] == "POST /payments/initiate"
+    assert server_span["trace_id"] == trace_id
+    assert server_span["parent_id"] == "00f067aa0ba902b7"
+
+    sent = []
+    transport = httpx.MockTransport(lambda request: sent.append(request.headers["traceparent"]) or httpx.Response(200))
+    monkeypatch.setattr(payment_app, "notification_client", httpx.AsyncClient(
+        transport=TracingTransport(transport, "notification-service", payment_app.tracer)
+    ))
+    [(_, payload, _)] = payment_app.outbox._claim()
+    asyncio.run(payment_app.send_notification(payload))
+    assert sent[0].startswith(f"00-{trace_id}-") and sent[0].endswith("-01")
+    assert [span["name"] for span in exporter.spans[-2:]] == ["HTTP POST", "outbox.deliver"]
+
+def test_client_span_finished_when_request_fails(monkeypatch):
+    import asyncio
+    import httpx
+    import app as payment_app
+    from tracing import MemoryExporter, TracingTransport, parse_traceparent
+    exporter = MemoryExporter()
+    monkeypatch.setattr(payment_app.tracer, "exporter", exporter)
+
+    def refuse(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    async def call():
+        async with httpx.AsyncClient(transport=TracingTransport(httpx.MockTransport(refuse), "notification-service", payment_app.tracer)) as http:
+            with payment_app.tracer.span("outbox.deliver", parent=parse_traceparent(f"00-{'1' * 32}-{'2' * 16}-01")):
+                await http.post("http://notify/notify/email", json={})
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(call())
+    client_span = exporter.spans[0]
+    assert client_span["name"] == "HTTP POST"
+    assert client_span["error"] == "ConnectError"
+
+def test_unsampled_trace_records_nothing(monkeypatch):
+    import app as payment_app
+    from tracing import MemoryExporter
+    exporter = MemoryExporter()
+    monkeypatch.setattr(payment_app.tracer, "exporter", exporter)
+    client.get("/health", headers={"traceparent": "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00"})
+    assert exporter.spans == []
@@ -1,52 +1,261 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Request, Header, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Optional
+import asyncio
 import httpx
+import os
+import time
+from metrics import MetricsMiddleware, MetricsTransport, metrics_response
+from singleflight import SingleFlight
+from resilience import CircuitBreaker, ResilientTransport, RetryBudget
+from models import UserRegister, UserLogin, CourseCreate, EnrollmentCreate, PaymentInitiate, EmailNotification, CheckoutRequest
+from tracing import TracingMiddleware, TracingTransport, create_tracer
+from signed_tokens import InvalidToken, is_signed_token, load_keyset, verify_token
+
+SERVICES = {
+    "user-service": os.getenv("USER_SERVICE_URL", "http://user-service.learning-portal.local:8080"),
+    "course-service": os.getenv("COURSE_SERVICE_URL", "http://course-service.learning-portal.local:8080"),
+    "enrollment-service": os.getenv("ENROLLMENT_SERVICE_URL", "http://enrollment-service.learning-portal.local:8080"),
+    "payment-service": os.getenv("PAYMENT_SERVICE_URL", "http://payment-service.learning-portal.local:8080"),
+    "notification-service": os.getenv("NOTIFICATION_SERVICE_URL", "http://notification-service.learning-portal.local:8080"),
+}
+
+POOL_MAX_CONNECTIONS = int(os.getenv("GATEWAY_POOL_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.getenv("GATEWAY_POOL_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("GATEWAY_POOL_KEEPALIVE_EXPIRY", "30"))
+POOL_HTTP2 = os.getenv("GATEWAY_HTTP2", "false").lower() == "true"
+UPSTREAM_TIMEOUT = float(os.getenv("GATEWAY_UPSTREAM_TIMEOUT", "5"))
+# A dead upstream should cost a second, not the whole upstream timeout
+CONNECT_TIMEOUT = float(os.getenv("GATEWAY_CONNECT_TIMEOUT", "1"))
+# Exports run a full parallel scan before (file) or between (stream) writes
+EXPORT_TIMEOUT = httpx.Timeout(UPSTREAM_TIMEOUT, connect=CONNECT_TIMEOUT, read=float(os.getenv("GATEWAY_EXPORT_TIMEOUT", "600")))
+
+BREAKER_FAILURES = int(os.getenv("GATEWAY_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("GATEWAY_BREAKER_RESET", "10"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("GATEWAY_RETRY_MAX_ATTEMPTS", "2"))
+RETRY_BUDGET_RATIO = float(os.getenv("GATEWAY_RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("GATEWAY_RETRY_BUDGET_MIN_PER_SECOND", "1"))
+HEDGE_DELAY = float(os.getenv("GATEWAY_HEDGE_DELAY", "0"))
+
+MICRO_CACHE_TTL = float(os.getenv("GATEWAY_MICRO_CACHE_TTL", "0"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("GATEWAY_HEALTH_PROBE_TIMEOUT", "2"))
+HEALTH_BUDGET = float(os.getenv("GATEWAY_HEALTH_BUDGET", "3"))
+HEALTH_CACHE_TTL = float(os.getenv("GATEWAY_HEALTH_CACHE_TTL", "2"))
+
+clients = {}
+# Kept outside the clients so breaker state outlives a recreated client
+breakers = {service_name: CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET) for service_name in SERVICES}
+retry_budgets = {service_name: RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN_PER_SECOND) for service_name in SERVICES}
+tls = {"context": None}
+signing_keys = load_keyset()
+tracer = create_tracer("api-gateway")
+singleflight = SingleFlight(micro_cache_ttl=MICRO_CACHE_TTL)
+health_cache = {"results": None, "expires": 0.0, "task": None}
+
+def ssl_context():
+    # Shared by every upstream client; building one per client would load
+    # the CA bundle five times
+    if tls["context"] is None:
+        tls["context"] = httpx.create_ssl_context()
+    return tls["context"]
+
+def get_client(service_name):
+    # One long-lived client (and connection pool) per upstream service
+    client = clients.get(service_name)
+    if client is None or client.is_closed:
+        transport = httpx.AsyncHTTPTransport(
+            verify=ssl_context(),
+            limits=httpx.Limits(
+                max_connections=POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                keepalive_expiry=POOL_KEEPALIVE_EXPIRY
+            ),
+            http2=POOL_HTTP2
+        )
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=CONNECT_TIMEOUT),
+            # Metrics and the client span wrap the breaker and retries, so a
+            # call that never reached the upstream is still counted and traced
+            transport=TracingTransport(MetricsTransport(ResilientTransport(
+                transport,
+                breakers[service_name],
+                retry_budgets[service_name],
+                max_attempts=RETRY_MAX_ATTEMPTS,
+                hedge_delay=HEDGE_DELAY
+            ), service_name), service_name, tracer)
+        )
+        clients[service_name] = client
+    return client
+
+async def close_clients():
+    for client in clients.values():
+        await client.aclose()
+    clients.clear()
+
+def resilient_transport(client):
+    transport = client._transport
+    while not isinstance(transport, ResilientTransport):
+        transport = transport.transport
+    return transport
+
+def pool_stats(client):
+    pool = getattr(resilient_transport(client).transport, "_pool", None)
+    connections = list(getattr(pool, "connections", []))
+    idle = sum(1 for c in connections if c.is_idle())
+    return {
+        "open": not client.is_closed,
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "pending_requests": len(getattr(pool, "_requests", []))
+    }
+
+async def probe_service(service_name, service_url):
+    try:
+        response = await get_client(service_name).get(
+            f"{service_url}/health",
+            timeout=HEALTH_PROBE_TIMEOUT,
+            extensions={"retry": False, "probe": True}
+        )
+        return {
+            "status": "healthy" if response.status_code == 200 else "unhealthy",
+            "response": response.json()
+        }
+    except Exception as e:
+        return {"status": "unreachable", "error": str(e)}
+
+async def probe_all_services():
+    # Probe every service concurrently; anything still running when the
+    # overall budget runs out is cancelled and reported as unreachable
+    tasks = {
+        service_name: asyncio.create_task(probe_service(service_name, service_url))
+        for service_name, service_url in SERVICES.items()
+    }
+    done, pending = await asyncio.wait(tasks.values(), timeout=HEALTH_BUDGET)
+    for task in pending:
+        task.cancel()
+    results = {}
+    for service_name, task in tasks.items():
+        if task in done:
+            results[service_name] = task.result()
+        else:
+            results[service_name] = {"status": "unreachable", "error": "health check budget exceeded"}
+    return results
+
+def list_params(limit, next_token, stream):
+    params = {}
+    if limit is not None:
+        params["limit"] = limit
+    if next_token is not None:
+        params["next_token"] = next_token
+    if stream:
+        params["stream"] = "true"
+    return params
+
+async def proxy_stream(service_name, path, params, **kwargs):
+    # Relay the upstream body chunk by chunk instead of buffering it
+    client = get_client(service_name)
+    request = client.build_request("GET", f"{SERVICES[service_name]}{path}", params=params, **kwargs)
+    try:
+        response = await client.send(request, stream=True)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"{service_name} unreachable: {str(e)}")
+    headers = {}
+    if "content-encoding" in response.headers:
+        headers["content-encoding"] = response.headers["content-encoding"]
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        media_type=response.headers.get("content-type"),
+        headers=headers,
+        background=BackgroundTask(response.aclose)
+    )
+
+async def coalesced_get(service_name, path):
+    # Identical GETs already in flight share one upstream request. These are
+    # idempotent point reads, so they may also be hedged (GATEWAY_HEDGE_DELAY)
+    async def fetch():
+        response = await get_client(service_name).get(f"{SERVICES[service_name]}{path}", extensions={"hedge": True})
+        return response.status_code, response.json()
+    try:
+        return await singleflight.do(f"{service_name}{path}", fetch, cacheable=lambda result: result[0] < 500)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"{service_name} unreachable: {str(e)}")
+
+def idempotency_headers(idempotency_key, step=None):
+    if not idempotency_key:
+        return {}
+    return {"idempotency-key": f"{idempotency_key}:{step}" if step else idempotency_key}
+
+async def upstream_request(service_name, method, path, **kwargs):
+    # Returns the response on 2xx; otherwise raises an HTTPException that
+    # carries the upstream status code and detail
+    client = get_client(service_name)
+    try:
+        response = await client.request(method, f"{SERVICES[service_name]}{path}", **kwargs)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"{service_name} unreachable: {str(e)}")
+    if response.status_code >= 400:
+        try:
+            detail = response.json().get("detail", response.text)
+        except ValueError:
+            detail = response.text
+        raise HTTPException(status_code=response.status_code, detail=detail)
+    return response
+
+@asynccontextmanager
+async def lifespan(app):
+    # Clients are created on first use; load the CA bundle off the event
+    # loop now so neither startup nor the first request waits on it
+    app.state.startup_tasks = [asyncio.create_task(asyncio.to_thread(ssl_context))]
+    yield
+    for task in app.state.startup_tasks:
+        task.cancel()
+    await close_clients()
 
 app = FastAPI(
     title="Online Learning Portal - API Gateway",
     description="Unified API Gateway for all microservices",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-SERVICES = {
-    "user-service": "http://user-service.learning-portal.local:8080",
-    "course-service": "http://course-service.learning-portal.local:8080",
-    "enrollment-service": "http://enrollment-service.learning-portal.local:8080",
-    "payment-service": "http://payment-service.learning-portal.local:8080",
-    "notification-service": "http://notification-service.learning-portal.local:8080",
-}
+class TokenVerificationMiddleware:
+    """Verifies signed bearer tokens locally and exposes the claims as
+    request.state.user. Opaque tokens pass through untouched."""
+
+    def __init__(self, app, keyset):
+        self.app = app
+        self.keyset = keyset
 
-class UserRegister(BaseModel):
-    name: str
-    email: str
-    password: str
-    role: str = "student"
-
-class UserLogin(BaseModel):
-    email: str
-    password: str
-
-class CourseCreate(BaseModel):
-    title: str
-    price: float
-    instructor: str
-    description: str = ""
-
-class EnrollmentCreate(BaseModel):
-    user_id: str
-    course_id: str
-
-class PaymentInitiate(BaseModel):
-    enrollment_id: str
-    amount: float
-    method: str = "card"
-    user_email: str = ""
-
-class EmailNotification(BaseModel):
-    user_email: str
-    subject: str
-    body: str
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            user = None
+            for name, value in scope["headers"]:
+                if name == b"authorization":
+                    scheme, _, token = value.decode("latin-1").partition(" ")
+                    if scheme.lower() == "bearer" and is_signed_token(token):
+                        try:
+                            user = verify_token(token, self.keyset)
+                        except InvalidToken as e:
+                            response = JSONResponse(status_code=401, content={"detail": str(e)})
+                            await response(scope, receive, send)
+                            return
+                    break
+            scope.setdefault("state", {})["user"] = user
+        await self.app(scope, receive, send)
+
+app.add_middleware(TokenVerificationMiddleware, keyset=signing_keys)
+app.add_middleware(TracingMiddleware, tracer=tracer, edge=True)
+app.add_middleware(MetricsMiddleware)
+
+def require_user(request: Request):
+    user = getattr(request.state, "user", None)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    return user
 
 @app.get("/", tags=["Gateway"])
 def index():
@@ -62,198 +271,413 @@ def index():
 def health():
     return {"status": "healthy", "service": "api-gateway"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+@app.get("/gateway/pools", tags=["Gateway"])
+def gateway_pools():
+    return {
+        "limits": {
+            "max_connections": POOL_MAX_CONNECTIONS,
+            "max_keepalive_connections": POOL_MAX_KEEPALIVE,
+            "keepalive_expiry": POOL_KEEPALIVE_EXPIRY,
+            "http2": POOL_HTTP2
+        },
+        "pools": {name: pool_stats(client) for name, client in clients.items()}
+    }
+
+@app.get("/gateway/breakers", tags=["Gateway"])
+def gateway_breakers():
+    upstreams = {}
+    for service_name in SERVICES:
+        client = clients.get(service_name)
+        if client is not None and not client.is_closed:
+            upstreams[service_name] = resilient_transport(client).stats()
+        else:
+            upstreams[service_name] = {
+                "breaker": breakers[service_name].stats(),
+                "retry_budget": retry_budgets[service_name].stats()
+            }
+    return upstreams
+
+@app.get("/gateway/singleflight", tags=["Gateway"])
+def gateway_singleflight():
+    return singleflight.stats()
+
+@app.get("/auth/me", tags=["Gateway"])
+def whoami(user: dict = Depends(require_user)):
+    return {"user_id": user["sub"], "role": user["role"], "expires_at": user["exp"]}
+
 @app.get("/services/health", tags=["Gateway"])
 async def check_all_services():
-    results = {}
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        for service_name, service_url in SERVICES.items():
-            try:
-                response = await client.get(f"{service_url}/health")
-                results[service_name] = {
-                    "status": "healthy" if response.status_code == 200 else "unhealthy",
-                    "response": response.json()
-                }
-            except Exception as e:
-                results[service_name] = {"status": "unreachable", "error": str(e)}
+    if health_cache["results"] is not None and time.monotonic() < health_cache["expires"]:
+        return health_cache["results"]
+    task = health_cache["task"]
+    if task is None:
+        task = asyncio.create_task(probe_all_services())
+        health_cache["task"] = task
+    results = await asyncio.shield(task)
+    if health_cache["task"] is task:
+        health_cache["results"] = results
+        health_cache["expires"] = time.monotonic() + HEALTH_CACHE_TTL
+        health_cache["task"] = None
     return results
 
 @app.post("/users/register", tags=["User Service"])
 async def register_user(user: UserRegister):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{SERVICES['user-service']}/users/register",
-                json=user.dict()
-            )
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"user-service unreachable: {str(e)}")
+    client = get_client("user-service")
+    try:
+        response = await client.post(
+            f"{SERVICES['user-service']}/users/register",
+            json=user.model_dump()
+        )
+        return response.json()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"user-service unreachable: {str(e)}")
 
 @app.post("/users/login", tags=["User Service"])
 async def login_user(credentials: UserLogin):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{SERVICES['user-service']}/users/login",
-                json=credentials.dict()
-            )
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail=response.json())
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            raise HTTPException(status_code=e.response.status_code, detail=str(e))
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"user-service unreachable: {str(e)}")
+    client = get_client("user-service")
+    try:
+        response = await client.post(
+            f"{SERVICES['user-service']}/users/login",
+            json=credentials.model_dump()
+        )
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=response.json())
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"user-service unreachable: {str(e)}")
+
+@app.get("/users/validate", tags=["User Service"])
+async def validate_token(authorization: Optional[str] = Header(None)):
+    client = get_client("user-service")
+    try:
+        response = await client.get(
+            f"{SERVICES['user-service']}/users/validate",
+            headers={"authorization": authorization or ""}
+        )
+        return JSONResponse(status_code=response.status_code, content=response.json())
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"user-service unreachable: {str(e)}")
 
 @app.get("/users/list", tags=["User Service"])
-async def list_users():
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{SERVICES['user-service']}/users/list")
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"user-service unreachable: {str(e)}")
+async def list_users(
+    limit: Optional[int] = None,
+    next_token: Optional[str] = None,
+    stream: bool = False
+):
+    return await proxy_stream("user-service", "/users/list", list_params(limit, next_token, stream))
 
 @app.post("/courses/create", tags=["Course Service"])
 async def create_course(course: CourseCreate):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{SERVICES['course-service']}/courses/create",
-                json=course.dict()
-            )
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"course-service unreachable: {str(e)}")
+    client = get_client("course-service")
+    try:
+        response = await client.post(
+            f"{SERVICES['course-service']}/courses/create",
+            json=course.model_dump()
+        )
+        return response.json()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"course-service unreachable: {str(e)}")
+
+@app.post("/courses/import", tags=["Course Service"])
+async def import_courses(file: UploadFile = File(...), fmt: Optional[str] = Query(None, alias="format")):
+    client = get_client("course-service")
+    params = {"format": fmt} if fmt else {}
+    try:
+        response = await client.post(
+            f"{SERVICES['course-service']}/courses/import",
+            params=params,
+            files={"file": (file.filename, file.file, file.content_type)},
+            timeout=300.0
+        )
+        return JSONResponse(status_code=response.status_code, content=response.json())
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"course-service unreachable: {str(e)}")
 
 @app.get("/courses/list", tags=["Course Service"])
-async def list_courses():
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{SERVICES['course-service']}/courses/list")
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"course-service unreachable: {str(e)}")
+async def list_courses(
+    limit: Optional[int] = None,
+    next_token: Optional[str] = None,
+    stream: bool = False
+):
+    return await proxy_stream("course-service", "/courses/list", list_params(limit, next_token, stream))
 
 @app.get("/courses/{course_id}", tags=["Course Service"])
 async def get_course(course_id: str):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{SERVICES['course-service']}/courses/{course_id}")
-            if response.status_code == 404:
-                raise HTTPException(status_code=404, detail="Course not found")
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"course-service unreachable: {str(e)}")
+    status_code, body = await coalesced_get("course-service", f"/courses/{course_id}")
+    if status_code == 404:
+        raise HTTPException(status_code=404, detail="Course not found")
+    return body
 
 @app.post("/courses/upload", tags=["Course Service"])
 async def upload_course_material(course_id: str, file: UploadFile = File(...)):
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            file_content = await file.read()
-            files = {"file": (file.filename, file_content, file.content_type)}
-            response = await client.post(
-                f"{SERVICES['course-service']}/courses/upload",
-                params={"course_id": course_id},
-                files=files
-            )
-            if response.status_code == 404:
-                raise HTTPException(status_code=404, detail="Course not found")
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"course-service unreachable: {str(e)}")
+    client = get_client("course-service")
+    try:
+        files = {"file": (file.filename, file.file, file.content_type)}
+        response = await client.post(
+            f"{SERVICES['course-service']}/courses/upload",
+            params={"course_id": course_id},
+            files=files,
+            timeout=300.0
+        )
+        if response.status_code == 404:
+            raise HTTPException(status_code=404, detail="Course not found")
+        return response.json()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"course-service unreachable: {str(e)}")
 
 @app.post("/enrollments/enroll", tags=["Enrollment Service"])
-async def enroll_user(enrollment: EnrollmentCreate):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{SERVICES['enrollment-service']}/enrollments/enroll",
-                json=enrollment.dict()
-            )
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"enrollment-service unreachable: {str(e)}")
+async def enroll_user(enrollment: EnrollmentCreate, idempotency_key: Optional[str] = Header(None)):
+    client = get_client("enrollment-service")
+    try:
+        response = await client.post(
+            f"{SERVICES['enrollment-service']}/enrollments/enroll",
+            json=enrollment.model_dump(),
+            headers=idempotency_headers(idempotency_key)
+        )
+        return response.json()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"enrollment-service unreachable: {str(e)}")
 
-@app.get("/enrollments/{user_id}", tags=["Enrollment Service"])
-async def get_enrollments(user_id: str):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{SERVICES['enrollment-service']}/enrollments/{user_id}")
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"enrollment-service unreachable: {str(e)}")
+@app.get("/enrollments/export", tags=["Enrollment Service"])
+async def export_enrollments(segments: int = 4, fmt: str = Query("ndjson", alias="format")):
+    # A retry would start a second full scan while the first still runs
+    params = {"segments": segments, "format": fmt}
+    return await proxy_stream("enrollment-service", "/enrollments/export", params, timeout=EXPORT_TIMEOUT, extensions={"retry": False})
+
+@app.post("/enrollments/export", tags=["Enrollment Service"])
+async def export_enrollments_to_file(segments: int = 4, fmt: str = Query("ndjson", alias="format")):
+    response = await upstream_request(
+        "enrollment-service", "POST", "/enrollments/export",
+        params={"segments": segments, "format": fmt},
+        timeout=EXPORT_TIMEOUT
+    )
+    return response.json()
 
 @app.get("/enrollments/list", tags=["Enrollment Service"])
-async def list_enrollments():
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{SERVICES['enrollment-service']}/enrollments/list")
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"enrollment-service unreachable: {str(e)}")
+async def list_enrollments(
+    limit: Optional[int] = None,
+    next_token: Optional[str] = None,
+    stream: bool = False
+):
+    return await proxy_stream("enrollment-service", "/enrollments/list", list_params(limit, next_token, stream))
+
+@app.get("/enrollments/{user_id}", tags=["Enrollment Service"])
+async def get_enrollments(user_id: str, limit: Optional[int] = None, next_token: Optional[str] = None):
+    client = get_client("enrollment-service")
+    try:
+        response = await client.get(
+            f"{SERVICES['enrollment-service']}/enrollments/{user_id}",
+            params=list_params(limit, next_token, False)
+        )
+        return response.json()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"enrollment-service unreachable: {str(e)}")
 
 @app.post("/payments/initiate", tags=["Payment Service"])
-async def initiate_payment(payment: PaymentInitiate):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{SERVICES['payment-service']}/payments/initiate",
-                json=payment.dict()
-            )
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"payment-service unreachable: {str(e)}")
+async def initiate_payment(payment: PaymentInitiate, idempotency_key: Optional[str] = Header(None)):
+    client = get_client("payment-service")
+    try:
+        response = await client.post(
+            f"{SERVICES['payment-service']}/payments/initiate",
+            json=payment.model_dump(),
+            headers=idempotency_headers(idempotency_key)
+        )
+        return response.json()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"payment-service unreachable: {str(e)}")
 
 @app.get("/payments/status/{payment_id}", tags=["Payment Service"])
 async def get_payment_status(payment_id: str):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{SERVICES['payment-service']}/payments/status/{payment_id}")
-            if response.status_code == 404:
-                raise HTTPException(status_code=404, detail="Payment not found")
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"payment-service unreachable: {str(e)}")
+    status_code, body = await coalesced_get("payment-service", f"/payments/status/{payment_id}")
+    if status_code == 404:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    return body
 
 @app.get("/payments/list", tags=["Payment Service"])
-async def list_payments():
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{SERVICES['payment-service']}/payments/list")
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"payment-service unreachable: {str(e)}")
+async def list_payments(
+    limit: Optional[int] = None,
+    next_token: Optional[str] = None,
+    stream: bool = False
+):
+    return await proxy_stream("payment-service", "/payments/list", list_params(limit, next_token, stream))
+
+@app.get("/payments/export", tags=["Payment Service"])
+async def export_payments(segments: int = 4, fmt: str = Query("ndjson", alias="format")):
+    # A retry would start a second full scan while the first still runs
+    params = {"segments": segments, "format": fmt}
+    return await proxy_stream("payment-service", "/payments/export", params, timeout=EXPORT_TIMEOUT, extensions={"retry": False})
+
+@app.post("/payments/export", tags=["Payment Service"])
+async def export_payments_to_file(segments: int = 4, fmt: str = Query("ndjson", alias="format")):
+    response = await upstream_request(
+        "payment-service", "POST", "/payments/export",
+        params={"segments": segments, "format": fmt},
+        timeout=EXPORT_TIMEOUT
+    )
+    return response.json()
 
 @app.post("/notify/email", tags=["Notification Service"])
 async def send_email_notification(notification: EmailNotification):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{SERVICES['notification-service']}/notify/email",
-                json=notification.dict()
-            )
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"notification-service unreachable: {str(e)}")
+    client = get_client("notification-service")
+    try:
+        response = await client.post(
+            f"{SERVICES['notification-service']}/notify/email",
+            json=notification.model_dump()
+        )
+        return response.json()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"notification-service unreachable: {str(e)}")
+
+@app.post("/notify/email/batch", tags=["Notification Service"])
+async def send_email_batch(request: Request):
+    client = get_client("notification-service")
+    try:
+        response = await client.post(
+            f"{SERVICES['notification-service']}/notify/email/batch",
+            content=request.stream(),
+            headers={"content-type": request.headers.get("content-type", "application/json")},
+            timeout=60.0
+        )
+        return JSONResponse(status_code=response.status_code, content=response.json())
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"notification-service unreachable: {str(e)}")
 
 @app.post("/notify/success", tags=["Notification Service"])
 async def send_success_notification(data: dict):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{SERVICES['notification-service']}/notify/success",
-                json=data
-            )
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"notification-service unreachable: {str(e)}")
+    client = get_client("notification-service")
+    try:
+        response = await client.post(
+            f"{SERVICES['notification-service']}/notify/success",
+            json=data
+        )
+        return response.json()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"notification-service unreachable: {str(e)}")
 
 @app.get("/notifications/list", tags=["Notification Service"])
-async def list_notifications():
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{SERVICES['notification-service']}/notifications/list")
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"notification-service unreachable: {str(e)}")
+async def list_notifications(
+    limit: Optional[int] = None,
+    next_token: Optional[str] = None,
+    stream: bool = False
+):
+    return await proxy_stream("notification-service", "/notifications/list", list_params(limit, next_token, stream))
+
+async def lookup_course_price(course_id):
+    response = await upstream_request("course-service", "GET", f"/courses/{course_id}")
+    return float(response.json()["price"])
+
+def check_checkout_credentials(request, user_id):
+    # Runs before anything is written: no token, or a signed token for
+    # someone else, is rejected without touching the upstreams
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        if user["sub"] != user_id:
+            raise HTTPException(status_code=403, detail="Token does not belong to this user")
+        return
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+async def validate_checkout_user(request, user_id):
+    # Only opaque tokens get here with something left to check, and that
+    # needs user-service
+    if getattr(request.state, "user", None) is not None:
+        return
+    response = await upstream_request(
+        "user-service", "GET", "/users/validate",
+        headers={"authorization": request.headers["authorization"]}
+    )
+    if response.json()["user_id"] != user_id:
+        raise HTTPException(status_code=403, detail="Token does not belong to this user")
+
+async def create_enrollment(order, idempotency_key):
+    response = await upstream_request(
+        "enrollment-service", "POST", "/enrollments/enroll",
+        json={"user_id": order.user_id, "course_id": order.course_id},
+        headers=idempotency_headers(idempotency_key, "enroll")
+    )
+    return response.json()["enrollment_id"]
+
+async def set_enrollment_status(enrollment_id, status):
+    await upstream_request(
+        "enrollment-service", "POST", f"/enrollments/{enrollment_id}/status",
+        json={"status": status}
+    )
+
+async def compensate_enrollment(enrollment_id):
+    try:
+        await set_enrollment_status(enrollment_id, "cancelled")
+    except HTTPException:
+        pass
+
+@app.post("/checkout", tags=["Checkout"])
+async def checkout(order: CheckoutRequest, request: Request, idempotency_key: Optional[str] = Header(None)):
+    check_checkout_credentials(request, order.user_id)
+    # Course lookup, opaque-token validation and the enrollment write don't
+    # depend on each other, so they run concurrently
+    price, user_check, enrollment_id = await asyncio.gather(
+        lookup_course_price(order.course_id),
+        validate_checkout_user(request, order.user_id),
+        create_enrollment(order, idempotency_key),
+        return_exceptions=True
+    )
+    failure = next((r for r in (price, user_check, enrollment_id) if isinstance(r, Exception)), None)
+    if failure is not None:
+        if not isinstance(enrollment_id, Exception):
+            await compensate_enrollment(enrollment_id)
+        if isinstance(failure, HTTPException):
+            raise failure
+        raise HTTPException(status_code=502, detail=f"checkout failed: {str(failure)}")
+
+    try:
+        payment = await upstream_request(
+            "payment-service", "POST", "/payments/initiate",
+            json={
+                "enrollment_id": enrollment_id,
+                "amount": price,
+                "method": order.method,
+                "user_email": order.user_email
+            },
+            headers=idempotency_headers(idempotency_key, "pay")
+        )
+    except HTTPException as e:
+        if 400 <= e.status_code < 500:
+            # Definitely rejected, so nothing was charged
+            await compensate_enrollment(enrollment_id)
+            raise
+        # A timeout, dropped connection or 5xx may come after the charge
+        # committed. Cancelling could leave a paid-for course cancelled, so
+        # the enrollment stays pending_payment for reconciliation; a retry
+        # with the same Idempotency-Key resolves to the same payment
+        return JSONResponse(status_code=202, content={
+            "status": "payment_unconfirmed",
+            "enrollment_id": enrollment_id,
+            "enrollment_status": "pending_payment",
+            "course_id": order.course_id,
+            "amount": price,
+            "detail": e.detail
+        })
+    payment_id = payment.json()["payment_id"]
+
+    enrollment_status = "paid"
+    try:
+        await set_enrollment_status(enrollment_id, "paid")
+    except HTTPException:
+        # The charge went through, so the enrollment must not be cancelled;
+        # leave it pending for reconciliation
+        enrollment_status = "pending_payment"
+
+    return {
+        "status": "completed" if enrollment_status == "paid" else "payment_captured",
+        "enrollment_id": enrollment_id,
+        "enrollment_status": enrollment_status,
+        "payment_id": payment_id,
+        "course_id": order.course_id,
+        "amount": price
+    }
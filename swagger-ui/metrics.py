@@ -0,0 +1,161 @@
+import bisect
+import threading
+import time
+import httpx
+from fastapi.responses import PlainTextResponse
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, name, label_names):
+        lines = [f"# TYPE {name} histogram"]
+        for labels, (counts, total, count) in self.series.items():
+            base = _labels(label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{base},le="+Inf"}} {count}')
+            lines.append(f"{name}_sum{{{base}}} {total}")
+            lines.append(f"{name}_count{{{base}}} {count}")
+        return lines
+
+def _labels(names, values):
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.in_flight = 0
+        self.request_latency = Histogram()
+        self.dependency_calls = {}
+        self.dependency_latency = Histogram()
+
+    def request_started(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def request_finished(self, method, route, status, seconds):
+        with self.lock:
+            self.in_flight -= 1
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.request_latency.observe((method, route), seconds)
+
+    def dependency_call(self, dependency, operation, outcome, seconds):
+        with self.lock:
+            key = (dependency, operation, outcome)
+            self.dependency_calls[key] = self.dependency_calls.get(key, 0) + 1
+            self.dependency_latency.observe((dependency, operation), seconds)
+
+    def render(self):
+        with self.lock:
+            lines = ["# TYPE http_requests_total counter"]
+            for key, count in self.requests.items():
+                lines.append(f"http_requests_total{{{_labels(('method', 'route', 'status'), key)}}} {count}")
+            lines.append("# TYPE http_requests_in_flight gauge")
+            lines.append(f"http_requests_in_flight {self.in_flight}")
+            lines += self.request_latency.render("http_request_duration_seconds", ("method", "route"))
+            lines.append("# TYPE dependency_calls_total counter")
+            for key, count in self.dependency_calls.items():
+                lines.append(f"dependency_calls_total{{{_labels(('dependency', 'operation', 'outcome'), key)}}} {count}")
+            lines += self.dependency_latency.render("dependency_call_duration_seconds", ("dependency", "operation"))
+        return "\n".join(lines) + "\n"
+
+METRICS = Metrics()
+
+class MetricsMiddleware:
+    """Records count, latency and in-flight requests per route template."""
+
+    def __init__(self, app, metrics=METRICS):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        self.metrics.request_started()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Label by route template, not raw path, to keep cardinality bounded
+            route = scope.get("route")
+            self.metrics.request_finished(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                status[0],
+                time.perf_counter() - started
+            )
+
+def instrument_dynamodb(resource, metrics=METRICS):
+    events = resource.meta.client.meta.events
+
+    def before_call(model, context, **kwargs):
+        context["metrics_call"] = (model.name, time.perf_counter())
+
+    def finished(context, outcome):
+        call = context.pop("metrics_call", None)
+        if call is not None:
+            metrics.dependency_call("dynamodb", call[0], outcome, time.perf_counter() - call[1])
+
+    def after_call(http_response, context, **kwargs):
+        finished(context, "ok" if http_response.status_code < 400 else "error")
+
+    def after_call_error(context, **kwargs):
+        finished(context, "error")
+
+    events.register("before-parameter-build.dynamodb", before_call)
+    events.register("after-call.dynamodb", after_call)
+    events.register("after-call-error.dynamodb", after_call_error)
+
+class MetricsTransport(httpx.AsyncBaseTransport):
+    """Wraps an httpx transport to time every outbound call to ``dependency``.
+
+    Timing the transport rather than hooking the response means calls that
+    never get one (connect errors, timeouts, an open circuit) are counted
+    too, as errors.
+    """
+
+    def __init__(self, transport, dependency, metrics=METRICS):
+        self.transport = transport
+        self.dependency = dependency
+        self.metrics = metrics
+
+    async def handle_async_request(self, request):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self.transport.handle_async_request(request)
+            if response.status_code < 500:
+                outcome = "ok"
+            return response
+        finally:
+            self.metrics.dependency_call(self.dependency, request.method, outcome, time.perf_counter() - started)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+def metrics_response(metrics=METRICS):
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
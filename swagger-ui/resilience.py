@@ -0,0 +1,250 @@
+import asyncio
+import random
+import time
+
+import httpx
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+RETRYABLE_STATUS = frozenset({502, 503, 504})
+
+class CircuitOpen(httpx.TransportError):
+    """Raised instead of contacting an upstream whose breaker is open."""
+
+class CircuitBreaker:
+    """Per-upstream breaker: closed -> open after ``failure_threshold``
+    consecutive failures, then half-open after ``reset_timeout`` seconds,
+    when a single probe request decides whether it closes again.
+
+    Failures are transport errors and 5xx responses; a 4xx means the
+    upstream is up and answering.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.probing:
+                self.rejected += 1
+                return False
+            self.probing = True
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def retry_after(self):
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "retry_after": round(self.retry_after(), 3),
+            "times_opened": self.opened,
+            "rejected": self.rejected
+        }
+
+class RetryBudget:
+    """Caps retries and hedges at a fraction of recent traffic.
+
+    Every request deposits ``ratio`` tokens and every extra attempt spends
+    one, so when an upstream fails outright the gateway adds at most
+    ``ratio`` more load instead of multiplying it. ``min_per_second`` tokens
+    accrue with time so a quiet upstream can still be retried.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=1.0, max_tokens=10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.updated_at = time.monotonic()
+        self.spent = 0
+        self.exhausted = 0
+
+    def _refill(self, amount):
+        now = time.monotonic()
+        amount += (now - self.updated_at) * self.min_per_second
+        self.updated_at = now
+        self.tokens = min(self.max_tokens, self.tokens + amount)
+
+    def deposit(self):
+        self._refill(self.ratio)
+
+    def withdraw(self):
+        self._refill(0.0)
+        if self.tokens < 1:
+            self.exhausted += 1
+            return False
+        self.tokens -= 1
+        self.spent += 1
+        return True
+
+    def stats(self):
+        self._refill(0.0)
+        return {
+            "ratio": self.ratio,
+            "tokens": round(self.tokens, 2),
+            "spent": self.spent,
+            "exhausted": self.exhausted
+        }
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """Wraps an upstream's transport with its breaker, bounded retries and
+    optional hedging.
+
+    Retries (at most ``max_attempts`` in total, budget permitting) cover
+    connection failures for any request whose body can be replayed, and
+    timeouts and 502/503/504 for idempotent methods. A GET sent with
+    ``extensions={"hedge": True}`` starts a second attempt if the first
+    hasn't answered within ``hedge_delay`` seconds and takes whichever
+    answers first. ``extensions={"retry": False}`` opts a request out of
+    retries, for reads too expensive to run twice. ``extensions={"probe":
+    True}`` marks a health probe: it goes straight to the upstream, is
+    never retried and neither counts toward nor is blocked by the breaker,
+    so one slow /health can't open it for real traffic.
+    """
+
+    def __init__(self, transport, breaker, budget, max_attempts=2, backoff=0.05, hedge_delay=0.0):
+        self.transport = transport
+        self.breaker = breaker
+        self.budget = budget
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.hedge_delay = hedge_delay
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _retryable(self, request, error=None, response=None):
+        if request.extensions.get("retry") is False:
+            return False
+        if response is not None:
+            return request.method in IDEMPOTENT_METHODS and response.status_code in RETRYABLE_STATUS
+        if isinstance(error, httpx.ConnectError):
+            # Nothing reached the upstream; safe to resend if the body can be
+            return isinstance(request.stream, httpx.ByteStream)
+        return request.method in IDEMPOTENT_METHODS and isinstance(error, (httpx.TimeoutException, httpx.NetworkError))
+
+    async def _attempt(self, request):
+        if not self.breaker.allow():
+            raise CircuitOpen(f"circuit open, retry in {self.breaker.retry_after():.1f}s", request=request)
+        try:
+            response = await self.transport.handle_async_request(request)
+        except asyncio.CancelledError:
+            # A losing hedge: neither success nor failure, but free the probe
+            self.breaker.probing = False
+            raise
+        except httpx.TransportError:
+            self.breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    async def _hedged(self, request):
+        attempts = [asyncio.ensure_future(self._attempt(request))]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=self.hedge_delay)
+            if not done and self.budget.withdraw():
+                self.hedges += 1
+                attempts.append(asyncio.ensure_future(self._attempt(request)))
+            pending = set(attempts)
+            failure = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        if task is not attempts[0]:
+                            self.hedge_wins += 1
+                        return task.result()
+                    failure = task.exception()
+            raise failure
+        finally:
+            # Also runs when the caller goes away; nothing may keep running
+            # or keep a pooled connection checked out
+            for task in attempts:
+                if task is winner:
+                    continue
+                if task.done():
+                    _close_response(task)
+                else:
+                    task.cancel()
+                    task.add_done_callback(_close_response)
+
+    async def handle_async_request(self, request):
+        if request.extensions.get("probe"):
+            return await self.transport.handle_async_request(request)
+        self.budget.deposit()
+        hedge = self.hedge_delay > 0 and request.method == "GET" and request.extensions.get("hedge")
+        attempt = 1
+        while True:
+            try:
+                if hedge:
+                    response = await self._hedged(request)
+                else:
+                    response = await self._attempt(request)
+            except CircuitOpen:
+                raise
+            except httpx.TransportError as e:
+                if attempt >= self.max_attempts or not self._retryable(request, error=e) or not self.budget.withdraw():
+                    raise
+            else:
+                if attempt >= self.max_attempts or not self._retryable(request, response=response) or not self.budget.withdraw():
+                    return response
+                await response.aclose()
+            self.retries += 1
+            attempt += 1
+            # Full jitter, so a burst of failures doesn't retry in lockstep
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 2)))
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+    def stats(self):
+        return {
+            "breaker": self.breaker.stats(),
+            "retry_budget": self.budget.stats(),
+            "max_attempts": self.max_attempts,
+            "retries": self.retries,
+            "hedge_delay": self.hedge_delay,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins
+        }
+
+def _close_response(task):
+    # A hedge that lost the race may still have produced a response
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(task.result().aclose())
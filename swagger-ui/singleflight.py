@@ -0,0 +1,67 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one upstream call.
+
+    The first caller starts the call as its own task; everyone else with the
+    same key awaits that task. A caller that disconnects doesn't cancel the
+    call for the others. With ``micro_cache_ttl`` > 0, successful results
+    are also kept for that many seconds.
+    """
+
+    def __init__(self, micro_cache_ttl=0.0, max_cached=10000):
+        self.micro_cache_ttl = micro_cache_ttl
+        self.max_cached = max_cached
+        self.inflight = {}
+        self.cache = OrderedDict()
+        self.leaders = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    def _cached(self, key):
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.cache[key]
+            return None
+        return entry
+
+    def _finished(self, key, task, cacheable):
+        self.inflight.pop(key, None)
+        if self.micro_cache_ttl <= 0 or task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if cacheable(result):
+            self.cache[key] = (time.monotonic() + self.micro_cache_ttl, result)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_cached:
+                self.cache.popitem(last=False)
+
+    async def do(self, key, fn, cacheable=lambda result: True):
+        if self.micro_cache_ttl > 0:
+            entry = self._cached(key)
+            if entry is not None:
+                self.cache_hits += 1
+                return entry[1]
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self.inflight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t, cacheable))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "in_flight": len(self.inflight),
+            "upstream_calls": self.leaders,
+            "coalesced": self.coalesced,
+            "micro_cache_ttl": self.micro_cache_ttl,
+            "micro_cache_entries": len(self.cache),
+            "micro_cache_hits": self.cache_hits
+        }
@@ -0,0 +1,445 @@
+import asyncio
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+import app as gateway
+from app import app
+from resilience import CircuitBreaker, CircuitOpen, ResilientTransport, RetryBudget
+
+client = TestClient(app)
+
+def test_health_check():
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["service"] == "api-gateway"
+
+def mock_upstreams(monkeypatch, routes, resilient=False):
+    """Route every upstream client to ``routes``: (method, path) -> response
+    or exception. Returns the list of (method, path) calls made."""
+    calls = []
+
+    def handler(request):
+        calls.append((request.method, request.url.path))
+        outcome = routes.get((request.method, request.url.path))
+        if outcome is None:
+            return httpx.Response(404, json={"detail": "Not Found"})
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def transport():
+        if not resilient:
+            return httpx.MockTransport(handler)
+        return ResilientTransport(httpx.MockTransport(handler), CircuitBreaker(), RetryBudget(), backoff=0)
+
+    monkeypatch.setattr(gateway, "clients", {
+        service_name: httpx.AsyncClient(transport=transport()) for service_name in gateway.SERVICES
+    })
+    return calls
+
+CHECKOUT_ROUTES = {
+    ("GET", "/courses/c1"): httpx.Response(200, json={"course_id": "c1", "price": "49.0"}),
+    ("GET", "/users/validate"): httpx.Response(200, json={"valid": True, "user_id": "u1", "role": "student"}),
+    ("POST", "/enrollments/enroll"): httpx.Response(200, json={"enrollment_id": "e1", "status": "pending_payment"}),
+    ("POST", "/payments/initiate"): httpx.Response(200, json={"payment_id": "p1", "status": "completed"}),
+    ("POST", "/enrollments/e1/status"): httpx.Response(200, json={"enrollment_id": "e1", "status": "paid"}),
+}
+ORDER = {"user_id": "u1", "course_id": "c1", "user_email": "u1@test.com"}
+AUTH = {"Authorization": "Bearer opaque-token"}
+
+def test_checkout_success(monkeypatch):
+    calls = mock_upstreams(monkeypatch, CHECKOUT_ROUTES)
+    response = client.post("/checkout", json=ORDER, headers=AUTH)
+    assert response.status_code == 200
+    assert response.json()["status"] == "completed"
+    assert response.json()["payment_id"] == "p1"
+    assert response.json()["amount"] == 49.0
+    assert ("POST", "/enrollments/e1/status") in calls
+
+def test_checkout_compensates_rejected_payment(monkeypatch):
+    routes = dict(CHECKOUT_ROUTES)
+    routes[("POST", "/payments/initiate")] = httpx.Response(402, json={"detail": "card declined"})
+    routes[("POST", "/enrollments/e1/status")] = httpx.Response(200, json={"status": "cancelled"})
+    calls = mock_upstreams(monkeypatch, routes)
+    response = client.post("/checkout", json=ORDER, headers=AUTH)
+    assert response.status_code == 402
+    assert ("POST", "/enrollments/e1/status") in calls
+
+@pytest.mark.parametrize("outcome", [
+    httpx.ReadTimeout("timed out"),
+    httpx.Response(500, json={"detail": "internal error"}),
+])
+def test_checkout_leaves_enrollment_pending_when_payment_outcome_unknown(monkeypatch, outcome):
+    routes = dict(CHECKOUT_ROUTES)
+    routes[("POST", "/payments/initiate")] = outcome
+    calls = mock_upstreams(monkeypatch, routes)
+    response = client.post("/checkout", json=ORDER, headers=AUTH)
+    assert response.status_code == 202
+    assert response.json()["status"] == "payment_unconfirmed"
+    assert response.json()["enrollment_status"] == "pending_payment"
+    assert ("POST", "/enrollments/e1/status") not in calls
+
+def test_checkout_payment_captured_but_status_update_failed(monkeypatch):
+    routes = dict(CHECKOUT_ROUTES)
+    routes[("POST", "/enrollments/e1/status")] = httpx.Response(503, json={"detail": "unavailable"})
+    mock_upstreams(monkeypatch, routes)
+    response = client.post("/checkout", json=ORDER, headers=AUTH)
+    assert response.status_code == 200
+    assert response.json()["status"] == "payment_captured"
+    assert response.json()["enrollment_status"] == "pending_payment"
+    assert response.json()["payment_id"] == "p1"
+
+def test_checkout_compensates_when_course_missing(monkeypatch):
+    routes = dict(CHECKOUT_ROUTES)
+    del routes[("GET", "/courses/c1")]
+    routes[("POST", "/enrollments/e1/status")] = httpx.Response(200, json={"status": "cancelled"})
+    calls = mock_upstreams(monkeypatch, routes)
+    response = client.post("/checkout", json=ORDER, headers=AUTH)
+    assert response.status_code == 404
+    assert ("POST", "/enrollments/e1/status") in calls
+    assert ("POST", "/payments/initiate") not in calls
+
+@pytest.mark.parametrize("headers", [{}, {"Authorization": "Basic dTE6cHc="}, {"Authorization": "Bearer "}])
+def test_checkout_without_credentials_writes_nothing(monkeypatch, headers):
+    calls = mock_upstreams(monkeypatch, CHECKOUT_ROUTES)
+    response = client.post("/checkout", json=ORDER, headers=headers)
+    assert response.status_code == 401
+    assert calls == []
+
+def use_signing_keys(monkeypatch, keys, active):
+    # The middleware holds this KeySet, so it is changed in place
+    monkeypatch.setattr(gateway.signing_keys, "keys", keys)
+    monkeypatch.setattr(gateway.signing_keys, "active_key_id", active)
+    monkeypatch.setattr(gateway.signing_keys, "path", None)
+
+def signed(claims, ttl=60):
+    import time
+    from signed_tokens import sign_token
+    return sign_token(dict(claims, exp=time.time() + ttl), gateway.signing_keys)
+
+def test_checkout_signed_token_for_another_user_writes_nothing(monkeypatch):
+    use_signing_keys(monkeypatch, {"k1": b"secret-1"}, "k1")
+    calls = mock_upstreams(monkeypatch, CHECKOUT_ROUTES)
+    token = signed({"sub": "someone-else", "role": "student"})
+    response = client.post("/checkout", json=ORDER, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+    assert calls == []
+
+def test_timed_out_export_is_not_retried(monkeypatch):
+    calls = mock_upstreams(monkeypatch, {
+        ("GET", "/payments/export"): httpx.ReadTimeout("timed out"),
+        ("GET", "/courses/c1"): httpx.ReadTimeout("timed out"),
+    }, resilient=True)
+    assert client.get("/payments/export").status_code == 503
+    assert calls == [("GET", "/payments/export")]
+    # An ordinary GET is still retried once
+    assert client.get("/courses/c1").status_code == 503
+    assert calls[1:] == [("GET", "/courses/c1")] * 2
+
+def test_file_export_is_a_post(monkeypatch):
+    calls = mock_upstreams(monkeypatch, {
+        ("POST", "/enrollments/export"): httpx.Response(200, json={"status": "exported", "items": 3}),
+    })
+    response = client.post("/enrollments/export", params={"segments": 2})
+    assert response.json()["status"] == "exported"
+    assert calls == [("POST", "/enrollments/export")]
+
+def resilient_call(transport, method="GET", path="/courses/c1", extensions=None):
+    async def call():
+        async with httpx.AsyncClient(transport=transport, base_url="http://upstream") as http:
+            return await http.request(method, path, extensions=extensions or {})
+    return asyncio.run(call())
+
+def test_get_retried_on_503_and_post_not():
+    statuses = iter([503, 200, 503, 200])
+    transport = ResilientTransport(
+        httpx.MockTransport(lambda request: httpx.Response(next(statuses))),
+        CircuitBreaker(), RetryBudget(), backoff=0
+    )
+    assert resilient_call(transport).status_code == 200
+    assert transport.retries == 1
+    assert resilient_call(transport, "POST", "/payments/initiate").status_code == 503
+    assert transport.retries == 1
+
+def test_retry_budget_caps_retries():
+    transport = ResilientTransport(
+        httpx.MockTransport(lambda request: httpx.Response(503)),
+        CircuitBreaker(failure_threshold=100), RetryBudget(ratio=0.0, min_per_second=0.0, max_tokens=1.0), backoff=0
+    )
+    resilient_call(transport)
+    resilient_call(transport)
+    assert transport.retries == 1
+    assert transport.budget.stats()["exhausted"] == 1
+
+def test_breaker_opens_then_half_open_probe_closes():
+    healthy = {"up": False}
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    transport = ResilientTransport(
+        httpx.MockTransport(lambda request: httpx.Response(200 if healthy["up"] else 500)),
+        breaker, RetryBudget(), backoff=0
+    )
+    resilient_call(transport)
+    resilient_call(transport)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        resilient_call(transport)
+    assert breaker.rejected == 1
+
+    # Once the reset timeout passes, a single probe is let through
+    breaker.opened_at -= breaker.reset_timeout
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.probing = False
+
+    healthy["up"] = True
+    assert resilient_call(transport).status_code == 200
+    assert breaker.state == "closed"
+
+def test_failed_half_open_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    transport = ResilientTransport(httpx.MockTransport(lambda request: httpx.Response(500)), breaker, RetryBudget(), max_attempts=1)
+    resilient_call(transport)
+    breaker.opened_at -= breaker.reset_timeout
+    resilient_call(transport)
+    assert breaker.state == "open"
+    assert breaker.stats()["times_opened"] == 2
+
+def test_health_probe_bypasses_breaker_and_retries():
+    calls = []
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    transport = ResilientTransport(
+        httpx.MockTransport(lambda request: calls.append(request.url.path) or httpx.Response(503)),
+        breaker, RetryBudget(), backoff=0
+    )
+    for _ in range(3):
+        assert resilient_call(transport, path="/health", extensions={"retry": False, "probe": True}).status_code == 503
+    assert calls == ["/health"] * 3
+    assert breaker.state == "closed"
+
+    with pytest.raises(CircuitOpen):
+        # Opens on the first 503, so the retry is refused
+        resilient_call(transport, path="/courses/c1")
+    assert breaker.state == "open"
+    # An open breaker doesn't hide the upstream's real health either
+    assert resilient_call(transport, path="/health", extensions={"probe": True}).status_code == 503
+
+def test_hedge_wins_over_slow_attempt():
+    attempts = []
+
+    async def handler(request):
+        attempts.append(request.url.path)
+        if len(attempts) == 1:
+            await asyncio.sleep(5)
+        return httpx.Response(200, json={"attempt": len(attempts)})
+
+    transport = ResilientTransport(httpx.MockTransport(handler), CircuitBreaker(), RetryBudget(), hedge_delay=0.01)
+    response = resilient_call(transport, extensions={"hedge": True})
+    assert response.json() == {"attempt": 2}
+    assert transport.hedges == 1
+    assert transport.hedge_wins == 1
+    assert transport.breaker.state == "closed"
+
+def test_get_without_hedge_extension_is_not_hedged():
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200)
+
+    transport = ResilientTransport(httpx.MockTransport(handler), CircuitBreaker(), RetryBudget(), hedge_delay=0.01)
+    assert resilient_call(transport).status_code == 200
+    assert transport.hedges == 0
+
+def test_singleflight_coalesces_concurrent_calls():
+    from singleflight import SingleFlight
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"course_id": "c1"}
+
+    async def burst():
+        return await asyncio.gather(*(flight.do("GET /courses/c1", fetch) for _ in range(10)))
+
+    assert asyncio.run(burst()) == [{"course_id": "c1"}] * 10
+    assert len(calls) == 1
+    assert flight.stats()["upstream_calls"] == 1
+    assert flight.stats()["coalesced"] == 9
+    assert flight.stats()["in_flight"] == 0
+
+def test_singleflight_survives_cancelled_leader():
+    from singleflight import SingleFlight
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "payload"
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "payload"
+        assert leader.cancelled()
+
+    asyncio.run(scenario())
+    assert flight.stats()["upstream_calls"] == 1
+
+def test_singleflight_micro_cache_ttl():
+    from singleflight import SingleFlight
+    flight = SingleFlight(micro_cache_ttl=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return len(calls)
+
+    async def scenario():
+        assert await flight.do("key", fetch) == 1
+        assert await flight.do("key", fetch) == 1
+        assert await flight.do("other", fetch, cacheable=lambda result: False) == 2
+        assert await flight.do("other", fetch, cacheable=lambda result: False) == 3
+        # Past its TTL the entry is dropped and the call goes upstream again
+        expires, result = flight.cache["key"]
+        flight.cache["key"] = (expires - 61, result)
+        assert await flight.do("key", fetch) == 4
+
+    asyncio.run(scenario())
+    assert flight.stats()["micro_cache_hits"] == 1
+
+def test_edge_ignores_client_sampling_flag(monkeypatch):
+    from tracing import MemoryExporter
+    exporter = MemoryExporter()
+    monkeypatch.setattr(gateway.tracer, "exporter", exporter)
+    monkeypatch.setattr(gateway.tracer, "sample_rate", 0.0)
+    forced = {"traceparent": "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"}
+    for _ in range(5):
+        client.get("/health", headers=forced)
+    assert exporter.spans == []
+
+    monkeypatch.setattr(gateway.tracer, "sample_rate", 1.0)
+    client.get("/health", headers=forced)
+    assert exporter.spans[-1]["trace_id"] == "4bf92f3577b34da6a3ce929d0e0e4736"
+
+def test_gateway_reuses_one_pooled_client_per_upstream(monkeypatch):
+    monkeypatch.setattr(gateway, "clients", {})
+    first = gateway.get_client("course-service")
+    assert gateway.get_client("course-service") is first
+    assert gateway.get_client("user-service") is not first
+
+    body = client.get("/gateway/pools").json()
+    assert body["limits"]["max_connections"] == gateway.POOL_MAX_CONNECTIONS
+    assert body["pools"]["course-service"] == {
+        "open": True, "connections": 0, "idle": 0, "active": 0, "pending_requests": 0
+    }
+
+    # A closed client is replaced on next use, breaker state is not
+    asyncio.run(first.aclose())
+    assert client.get("/gateway/pools").json()["pools"]["course-service"]["open"] is False
+    replacement = gateway.get_client("course-service")
+    assert replacement is not first
+    assert gateway.resilient_transport(replacement).breaker is gateway.breakers["course-service"]
+
+def mock_health(monkeypatch, behaviour):
+    """Serve each upstream's /health from ``behaviour``: host -> response,
+    exception or a delay in seconds. Returns the hosts probed."""
+    probed = []
+
+    async def handler(request):
+        probed.append(request.url.host)
+        outcome = behaviour.get(request.url.host.split(".")[0], httpx.Response(200, json={"status": "healthy"}))
+        if isinstance(outcome, float):
+            await asyncio.sleep(outcome)
+            return httpx.Response(200, json={"status": "healthy"})
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(gateway, "clients", {
+        service_name: httpx.AsyncClient(transport=httpx.MockTransport(handler)) for service_name in gateway.SERVICES
+    })
+    monkeypatch.setattr(gateway, "health_cache", {"results": None, "expires": 0.0, "task": None})
+    return probed
+
+def test_services_health_fans_out_and_caches(monkeypatch):
+    probed = mock_health(monkeypatch, {
+        "payment-service": httpx.Response(503, json={"status": "down"}),
+        "notification-service": httpx.ConnectError("connection refused")
+    })
+    results = client.get("/services/health").json()
+    assert results["user-service"]["status"] == "healthy"
+    assert results["payment-service"]["status"] == "unhealthy"
+    assert results["notification-service"]["status"] == "unreachable"
+    assert len(probed) == 5
+
+    # Served from the short-lived cache
+    assert client.get("/services/health").json() == results
+    assert len(probed) == 5
+
+def test_services_health_reports_slow_service_within_budget(monkeypatch):
+    import time
+    mock_health(monkeypatch, {"course-service": 5.0})
+    monkeypatch.setattr(gateway, "HEALTH_BUDGET", 0.2)
+    started = time.monotonic()
+    results = client.get("/services/health").json()
+    assert time.monotonic() - started < 2
+    assert results["course-service"] == {"status": "unreachable", "error": "health check budget exceeded"}
+    assert results["enrollment-service"]["status"] == "healthy"
+
+def test_auth_me_with_signed_token(monkeypatch):
+    use_signing_keys(monkeypatch, {"k1": b"secret-1"}, "k1")
+    token = signed({"sub": "u1", "role": "student"})
+    response = client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()["user_id"] == "u1"
+    assert response.json()["role"] == "student"
+
+def test_auth_me_requires_verified_claims(monkeypatch):
+    use_signing_keys(monkeypatch, {"k1": b"secret-1"}, "k1")
+    assert client.get("/auth/me").status_code == 401
+    # Opaque tokens pass through the middleware unverified
+    assert client.get("/auth/me", headers=AUTH).status_code == 401
+
+def test_expired_and_tampered_tokens_rejected(monkeypatch):
+    use_signing_keys(monkeypatch, {"k1": b"secret-1"}, "k1")
+    expired = signed({"sub": "u1", "role": "student"}, ttl=-1)
+    response = client.get("/auth/me", headers={"Authorization": f"Bearer {expired}"})
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token expired"
+
+    token = signed({"sub": "u1", "role": "student"})
+    tampered = token[:-2] + ("AA" if not token.endswith("AA") else "BB")
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {tampered}"}).status_code == 401
+
+def test_tokens_survive_key_rotation(monkeypatch):
+    use_signing_keys(monkeypatch, {"k1": b"secret-1"}, "k1")
+    old = signed({"sub": "u1", "role": "student"})
+
+    # k2 becomes active; tokens signed with k1 stay valid until k1 is removed
+    use_signing_keys(monkeypatch, {"k1": b"secret-1", "k2": b"secret-2"}, "k2")
+    new = signed({"sub": "u1", "role": "student"})
+    assert new.split(".")[1] == "k2"
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {old}"}).status_code == 200
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {new}"}).status_code == 200
+
+    use_signing_keys(monkeypatch, {"k2": b"secret-2"}, "k2")
+    response = client.get("/auth/me", headers={"Authorization": f"Bearer {old}"})
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Unknown signing key"
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {new}"}).status_code == 200
+
+def test_keyset_reloads_rotated_keys_file(tmp_path):
+    import json
+    from signed_tokens import KeySet, sign_token, verify_token
+    path = tmp_path / "keys.json"
+    path.write_text(json.dumps({"active": "k1", "keys": {"k1": "secret-1"}}))
+    keyset = KeySet(path=str(path))
+    path.write_text(json.dumps({"active": "k2", "keys": {"k1": "secret-1", "k2": "secret-2"}}))
+    issuer = KeySet(path=str(path))
+    token = sign_token({"sub": "u1", "exp": 2 ** 32}, issuer)
+    # An unknown kid forces a reload (at most once a second)
+    keyset.loaded_at -= 2
+    assert verify_token(token, keyset)["sub"] == "u1"
@@ -1,31 +1,102 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import hashlib
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Header
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import asyncio
+import logging
+import os
 import secrets
-import boto3
+import time
 from boto3.dynamodb.conditions import Key
+from dynamo import BOTO_CONFIG, run_db, scan_page, scan_all, ndjson_lines
+from storage import connect_in_background, create_storage
+from models import UserRegister, UserLogin
+from token_store import create_token_store
+from signed_tokens import load_keyset, sign_token
+from passwords import hash_password_async, verify_password_async, needs_rehash, shutdown_pool
+from email_cache import EmailCache
+from metrics import MetricsMiddleware, instrument_dynamodb, metrics_response
+from tracing import TracingMiddleware, create_tracer, trace_dynamodb
 
-app = FastAPI(title="User Service", version="1.0.0")
+logger = logging.getLogger(__name__)
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-2')
-users_table = dynamodb.Table('learning-portal-users')
-tokens = {}
+@asynccontextmanager
+async def lifespan(app):
+    app.state.startup_tasks = [connect_in_background(storage)]
+    if EMAIL_CACHE_WARMUP:
+        app.state.startup_tasks.append(asyncio.create_task(warm_email_cache()))
+    yield
+    for task in app.state.startup_tasks:
+        task.cancel()
+    shutdown_pool()
 
-class UserRegister(BaseModel):
-    name: str
-    email: str
-    password: str
-    role: str = "student"
+tracer = create_tracer("user-service")
 
-class UserLogin(BaseModel):
-    email: str
-    password: str
+app = FastAPI(title="User Service", version="1.0.0", lifespan=lifespan)
+app.add_middleware(TracingMiddleware, tracer=tracer)
+app.add_middleware(MetricsMiddleware)
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EMAIL_CACHE_WARMUP = os.getenv("EMAIL_CACHE_WARMUP", "false").lower() == "true"
 
-def generate_token():
-    return secrets.token_hex(32)
+storage = create_storage(BOTO_CONFIG)
+storage.instrument(instrument_dynamodb)
+storage.instrument(trace_dynamodb, tracer)
+users_table = storage.Table('learning-portal-users')
+token_store = create_token_store()
+signing_keys = load_keyset()
+email_cache = EmailCache(
+    max_entries=int(os.getenv("EMAIL_CACHE_MAX_ENTRIES", "50000")),
+    ttl=float(os.getenv("EMAIL_CACHE_TTL", "300")),
+    negative_capacity=int(os.getenv("EMAIL_CACHE_NEGATIVE_MAX_ENTRIES", "100000")),
+    # Also how long another replica may refuse a just-registered email
+    negative_ttl=float(os.getenv("EMAIL_CACHE_NEGATIVE_TTL", "5"))
+)
+
+def generate_token(user):
+    # Signed tokens let the gateway authenticate requests without calling
+    # back here; without a signing key we fall back to opaque tokens
+    if signing_keys.active()[1] is None:
+        return secrets.token_hex(32)
+    now = int(time.time())
+    return sign_token({
+        "sub": user["user_id"],
+        "role": user["role"],
+        "iat": now,
+        "exp": now + token_store.ttl,
+        "jti": secrets.token_hex(8)
+    }, signing_keys)
+
+async def find_user_by_email(email, trust_negative=True):
+    user = email_cache.get(email)
+    if user is not None:
+        return user
+    if trust_negative and email_cache.is_known_absent(email):
+        return None
+    response = await run_db(
+        users_table, "query",
+        IndexName='EmailIndex',
+        KeyConditionExpression=Key('email').eq(email)
+    )
+    if not response['Items']:
+        email_cache.remember_absent(email)
+        return None
+    user = response['Items'][0]
+    email_cache.remember(user)
+    return user
+
+async def warm_email_cache():
+    def load():
+        for count, user in enumerate(scan_all(users_table), start=1):
+            email_cache.remember(user)
+            if count >= email_cache.max_entries:
+                break
+    try:
+        await run_db(load)
+        logger.info("email cache warmed: %s", email_cache.stats())
+    except Exception:
+        logger.exception("email cache warm-up failed")
 
 @app.get("/")
 def home():
@@ -35,25 +106,27 @@ def home():
 def health():
     return {"status": "healthy", "service": "user-service"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
 @app.post("/users/register")
-def register(user: UserRegister):
-    response = users_table.query(
-        IndexName='EmailIndex',
-        KeyConditionExpression=Key('email').eq(user.email)
-    )
-    if response['Items']:
+async def register(user: UserRegister):
+    # A write must not trust the negative cache: the email may have been
+    # registered through another replica since it was recorded as absent
+    if await find_user_by_email(user.email, trust_negative=False) is not None:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     user_id = f"u{secrets.token_hex(8)}"
-    users_table.put_item(
-        Item={
-            "user_id": user_id,
-            "name": user.name,
-            "email": user.email,
-            "password": hash_password(user.password),
-            "role": user.role
-        }
-    )
+    item = {
+        "user_id": user_id,
+        "name": user.name,
+        "email": user.email,
+        "password": await hash_password_async(user.password),
+        "role": user.role
+    }
+    await run_db(users_table, "put_item", Item=item)
+    email_cache.registered(item)
     
     return {
         "user_id": user_id,
@@ -64,45 +137,80 @@ def register(user: UserRegister):
     }
 
 @app.post("/users/login")
-def login(credentials: UserLogin):
-    response = users_table.query(
-        IndexName='EmailIndex',
-        KeyConditionExpression=Key('email').eq(credentials.email)
-    )
+async def login(credentials: UserLogin):
+    user = await find_user_by_email(credentials.email)
     
-    if not response['Items']:
+    if user is None:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    user = response['Items'][0]
-    
-    if user["password"] != hash_password(credentials.password):
+    if not await verify_password_async(credentials.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    token = generate_token()
-    tokens[token] = user["user_id"]
+    if needs_rehash(user["password"]):
+        # Upgrade legacy SHA-256 hashes (or old cost settings) in place
+        new_hash = await hash_password_async(credentials.password)
+        await run_db(
+            users_table, "update_item",
+            Key={'user_id': user["user_id"]},
+            UpdateExpression="SET password = :password",
+            ExpressionAttributeValues={':password': new_hash}
+        )
+        email_cache.remember(dict(user, password=new_hash))
+    
+    token = generate_token(user)
+    expires_at = await token_store.aissue(token, {"user_id": user["user_id"], "role": user["role"]})
     
     return {
         "token": token,
         "user_id": user["user_id"],
         "role": user["role"],
+        "expires_at": expires_at,
         "status": "logged_in"
     }
 
+@app.get("/cache/stats")
+def cache_stats():
+    return email_cache.stats()
+
+@app.get("/users/validate")
+def validate_token(authorization: Optional[str] = Header(None)):
+    scheme, _, token = (authorization or "").partition(" ")
+    session = token_store.get(token) if scheme.lower() == "bearer" and token else None
+    if session is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return {
+        "valid": True,
+        "user_id": session["user_id"],
+        "role": session["role"],
+        "expires_at": session["expires_at"]
+    }
+
+def public_user(u):
+    return {
+        "user_id": u["user_id"],
+        "name": u["name"],
+        "email": u["email"],
+        "role": u["role"]
+    }
+
 @app.get("/users/list")
-def list_users():
-    response = users_table.scan()
-    users_list = [
-        {
-            "user_id": u["user_id"],
-            "name": u["name"],
-            "email": u["email"],
-            "role": u["role"]
-        }
-        for u in response['Items']
-    ]
-    
+def list_users(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    next_token: Optional[str] = None,
+    stream: bool = False
+):
+    if stream:
+        return StreamingResponse(
+            ndjson_lines(scan_all(users_table), transform=public_user),
+            media_type="application/x-ndjson"
+        )
+    try:
+        items, token = scan_page(users_table, limit or DEFAULT_PAGE_SIZE, next_token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    users_list = [public_user(u) for u in items]
     return {
         "total": len(users_list),
-        "users": users_list
+        "users": users_list,
+        "next_token": token
     }
-
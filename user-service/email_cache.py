@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+
+class EmailCache:
+    """Email -> user record cache for the EmailIndex lookups.
+
+    Known users sit in an LRU bounded by ``max_entries`` with a TTL.
+    Emails confirmed absent sit in a second, exact LRU bounded by
+    ``negative_capacity`` that expires entries after ``negative_ttl``
+    seconds. It must be exact: login answers 401 on a negative hit, so a
+    false positive would lock a real user out. A flood of unknown emails
+    only evicts older negatives, which costs index queries, not correctness.
+    """
+
+    def __init__(self, max_entries=50000, ttl=300.0, negative_capacity=100000, negative_ttl=5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_capacity = negative_capacity
+        self.negative_ttl = negative_ttl
+        self.users = OrderedDict()
+        self.absent = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+
+    def get(self, email):
+        with self.lock:
+            entry = self.users.get(email)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.users[email]
+                self.misses += 1
+                return None
+            self.users.move_to_end(email)
+            self.hits += 1
+            return entry[1]
+
+    def remember(self, user):
+        with self.lock:
+            self.users[user["email"]] = (time.monotonic() + self.ttl, user)
+            self.users.move_to_end(user["email"])
+            while len(self.users) > self.max_entries:
+                self.users.popitem(last=False)
+                self.evictions += 1
+
+    def is_known_absent(self, email):
+        with self.lock:
+            expires_at = self.absent.get(email)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self.absent[email]
+                return False
+            self.negative_hits += 1
+            return True
+
+    def remember_absent(self, email):
+        with self.lock:
+            self.absent[email] = time.monotonic() + self.negative_ttl
+            self.absent.move_to_end(email)
+            while len(self.absent) > self.negative_capacity:
+                self.absent.popitem(last=False)
+
+    def registered(self, user):
+        self.remember(user)
+        with self.lock:
+            self.absent.pop(user["email"], None)
+
+    def stats(self):
+        return {
+            "entries": len(self.users),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "evictions": self.evictions,
+            "absent_entries": len(self.absent),
+            "negative_ttl": self.negative_ttl
+        }
@@ -0,0 +1,47 @@
+"""Request bodies, defined once for the services and the gateway.
+
+Each service validates its own routes with these and the gateway validates
+the same bodies before forwarding, so the two sides can't drift apart.
+"""
+from typing import Literal
+from pydantic import BaseModel
+
+class UserRegister(BaseModel):
+    name: str
+    email: str
+    password: str
+    role: str = "student"
+
+class UserLogin(BaseModel):
+    email: str
+    password: str
+
+class CourseCreate(BaseModel):
+    title: str
+    price: float
+    instructor: str
+    description: str = ""
+
+class EnrollmentCreate(BaseModel):
+    user_id: str
+    course_id: str
+
+class EnrollmentStatusUpdate(BaseModel):
+    status: Literal["pending_payment", "paid", "cancelled"]
+
+class PaymentInitiate(BaseModel):
+    enrollment_id: str
+    amount: float
+    method: str = "card"
+    user_email: str = ""
+
+class EmailNotification(BaseModel):
+    user_email: str
+    subject: str
+    body: str
+
+class CheckoutRequest(BaseModel):
+    user_id: str
+    course_id: str
+    method: str = "card"
+    user_email: str = ""
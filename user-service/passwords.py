@@ -0,0 +1,88 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+
+from serving import per_worker
+
+PASSWORD_KDF = os.getenv("PASSWORD_KDF", "scrypt")
+SCRYPT_N = int(os.getenv("SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(os.getenv("PBKDF2_ITERATIONS", "600000"))
+# Default to this worker's share of the CPUs, so several server workers
+# don't each start a hashing process per core
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "0")) or per_worker(os.cpu_count() or 1)
+
+_pool = None
+
+def _b64(raw):
+    return base64.b64encode(raw).decode()
+
+def current_params():
+    if PASSWORD_KDF == "pbkdf2":
+        return ("pbkdf2_sha256", PBKDF2_ITERATIONS)
+    return ("scrypt", SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024)
+
+def hash_password(password, params=None):
+    params = params or current_params()
+    salt = secrets.token_bytes(16)
+    if params[0] == "pbkdf2_sha256":
+        iterations = params[1]
+        derived = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+        return f"pbkdf2_sha256${iterations}${_b64(salt)}${_b64(derived)}"
+    _, n, r, p = params
+    derived = _scrypt(password, salt, n, r, p)
+    return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(derived)}"
+
+def verify_password(password, stored):
+    if "$" not in stored:
+        # Legacy unsalted SHA-256 hex digest
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored)
+    fields = stored.split("$")
+    if fields[0] == "pbkdf2_sha256":
+        _, iterations, salt, expected = fields
+        derived = hashlib.pbkdf2_hmac("sha256", password.encode(), base64.b64decode(salt), int(iterations))
+    elif fields[0] == "scrypt":
+        _, n, r, p, salt, expected = fields
+        derived = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    else:
+        return False
+    return hmac.compare_digest(derived, base64.b64decode(expected))
+
+def needs_rehash(stored, params=None):
+    params = params or current_params()
+    if "$" not in stored:
+        return True
+    fields = stored.split("$")
+    if fields[0] != params[0]:
+        # Another KDF: its fields don't line up with these params
+        return True
+    return tuple([fields[0]] + [int(v) for v in fields[1:len(params)]]) != tuple(params)
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+async def hash_password_async(password, params=None):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(), hash_password, password, params or current_params())
+
+async def verify_password_async(password, stored):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(), verify_password, password, stored)
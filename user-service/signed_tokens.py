@@ -0,0 +1,116 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+
+TOKEN_PREFIX = "v1"
+
+class InvalidToken(Exception):
+    pass
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _parse_keys(spec):
+    keys = {}
+    for entry in spec.split(","):
+        kid, _, secret = entry.strip().partition(":")
+        if kid and secret:
+            keys[kid] = secret.encode()
+    return keys
+
+class KeySet:
+    """Signing keys by key id, reloaded from TOKEN_KEYS_FILE when it changes.
+
+    The file holds ``{"active": "<kid>", "keys": {"<kid>": "<secret>"}}``.
+    Rotating means adding a new key, making it active, and removing the old
+    one once every token signed with it has expired.
+    """
+
+    def __init__(self, path=None, keys=None, active_key_id=None, refresh_interval=60.0):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.keys = dict(keys or {})
+        self.active_key_id = active_key_id or next(iter(self.keys), None)
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+        if path:
+            self.reload()
+
+    def reload(self):
+        with self.lock:
+            self.loaded_at = time.monotonic()
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                return
+            self.keys = {kid: secret.encode() for kid, secret in data.get("keys", {}).items()}
+            self.active_key_id = data.get("active") or next(iter(self.keys), None)
+
+    def _maybe_reload(self, force=False):
+        if not self.path:
+            return
+        elapsed = time.monotonic() - self.loaded_at
+        if elapsed > self.refresh_interval or (force and elapsed > 1.0):
+            self.reload()
+
+    def get(self, kid):
+        self._maybe_reload()
+        key = self.keys.get(kid)
+        if key is None:
+            # An unknown kid usually means the keys were just rotated
+            self._maybe_reload(force=True)
+            key = self.keys.get(kid)
+        return key
+
+    def active(self):
+        self._maybe_reload()
+        if self.active_key_id is None:
+            return None, None
+        return self.active_key_id, self.keys.get(self.active_key_id)
+
+def load_keyset():
+    return KeySet(
+        path=os.getenv("TOKEN_KEYS_FILE") or None,
+        keys=_parse_keys(os.getenv("TOKEN_SIGNING_KEYS", "")),
+        active_key_id=os.getenv("TOKEN_ACTIVE_KEY_ID") or None
+    )
+
+def sign_token(claims, keyset):
+    kid, key = keyset.active()
+    if key is None:
+        raise InvalidToken("No active signing key")
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    signing_input = f"{TOKEN_PREFIX}.{kid}.{payload}"
+    signature = _b64encode(hmac.new(key, signing_input.encode(), hashlib.sha256).digest())
+    return f"{signing_input}.{signature}"
+
+def is_signed_token(token):
+    return token.startswith(f"{TOKEN_PREFIX}.")
+
+def verify_token(token, keyset):
+    parts = token.split(".")
+    if len(parts) != 4 or parts[0] != TOKEN_PREFIX:
+        raise InvalidToken("Malformed token")
+    _, kid, payload, signature = parts
+    key = keyset.get(kid)
+    if key is None:
+        raise InvalidToken("Unknown signing key")
+    expected = hmac.new(key, f"{TOKEN_PREFIX}.{kid}.{payload}".encode(), hashlib.sha256).digest()
+    try:
+        valid = hmac.compare_digest(expected, _b64decode(signature))
+        claims = json.loads(_b64decode(payload)) if valid else None
+    except ValueError:
+        raise InvalidToken("Malformed token")
+    if not valid:
+        raise InvalidToken("Bad signature")
+    if claims.get("exp", 0) < time.time():
+        raise InvalidToken("Token expired")
+    return claims
@@ -26,3 +26,166 @@ def test_login_invalid_credentials():
     })
     assert response.status_code == 401
 
+def test_list_users_invalid_limit():
+    response = client.get("/users/list", params={"limit": 0})
+    assert response.status_code == 422
+
+def test_list_users_invalid_next_token():
+    response = client.get("/users/list", params={"limit": 10, "next_token": "not-a-token"})
+    assert response.status_code == 400
+
+def test_validate_missing_token():
+    response = client.get("/users/validate")
+    assert response.status_code == 401
+
+def test_validate_issued_token():
+    import app as user_app
+    user_app.token_store.issue("t1", {"user_id": "u1", "role": "student"})
+    response = client.get("/users/validate", headers={"Authorization": "Bearer t1"})
+    assert response.status_code == 200
+    assert response.json()["user_id"] == "u1"
+    assert response.json()["role"] == "student"
+
+def test_memory_token_store_expiry_and_bound():
+    from token_store import MemoryTokenStore
+    store = MemoryTokenStore(max_tokens=2, ttl=-1)
+    store.issue("expired", {"user_id": "u1", "role": "student"})
+    assert store.get("expired") is None
+    store = MemoryTokenStore(max_tokens=2, ttl=60)
+    for token in ("a", "b", "c"):
+        store.issue(token, {"user_id": token, "role": "student"})
+    assert store.get("a") is None
+    assert store.get("c")["user_id"] == "c"
+    assert store.stats()["evictions"] == 1
+
+def test_signed_token_roundtrip_and_rotation():
+    import time
+    import pytest
+    from signed_tokens import KeySet, InvalidToken, sign_token, verify_token
+    old_keys = KeySet(keys={"k1": b"old-secret"})
+    token = sign_token({"sub": "u1", "role": "student", "exp": time.time() + 60}, old_keys)
+    rotated = KeySet(keys={"k2": b"new-secret", "k1": b"old-secret"}, active_key_id="k2")
+    assert verify_token(token, rotated)["sub"] == "u1"
+    assert sign_token({"sub": "u2", "exp": time.time() + 60}, rotated).split(".")[1] == "k2"
+    with pytest.raises(InvalidToken):
+        verify_token(token, KeySet(keys={"k2": b"new-secret"}))
+    with pytest.raises(InvalidToken):
+        verify_token(token[:-4] + "AAAA", rotated)
+    expired = sign_token({"sub": "u1", "exp": time.time() - 1}, old_keys)
+    with pytest.raises(InvalidToken):
+        verify_token(expired, old_keys)
+
+def test_password_hash_roundtrip():
+    from passwords import hash_password, verify_password, needs_rehash
+    params = ("scrypt", 2 ** 10, 8, 1)
+    stored = hash_password("s3cret", params)
+    assert stored != hash_password("s3cret", params)
+    assert verify_password("s3cret", stored)
+    assert not verify_password("wrong", stored)
+    assert not needs_rehash(stored, params)
+    assert needs_rehash(stored, ("scrypt", 2 ** 11, 8, 1))
+    pbkdf2 = hash_password("s3cret", ("pbkdf2_sha256", 1000))
+    assert verify_password("s3cret", pbkdf2)
+    assert needs_rehash(pbkdf2, params)
+    assert needs_rehash(stored, ("pbkdf2_sha256", 1000))
+    assert not needs_rehash(pbkdf2, ("pbkdf2_sha256", 1000))
+
+class FakeUsersTable:
+    def __init__(self, users):
+        self.users = {u["user_id"]: u for u in users}
+
+    def query(self, IndexName, KeyConditionExpression):
+        email = KeyConditionExpression.get_expression()["values"][1]
+        return {"Items": [u for u in self.users.values() if u["email"] == email]}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues):
+        self.users[Key["user_id"]]["password"] = ExpressionAttributeValues[":password"]
+
+def test_login_upgrades_legacy_sha256_hash(monkeypatch):
+    import hashlib
+    import app as user_app
+    import passwords
+    monkeypatch.setattr(passwords, "SCRYPT_N", 2 ** 10)
+    legacy = hashlib.sha256(b"s3cret").hexdigest()
+    table = FakeUsersTable([{"user_id": "u1", "email": "a@test.com", "password": legacy, "role": "student"}])
+    monkeypatch.setattr(user_app, "users_table", table)
+    response = client.post("/users/login", json={"email": "a@test.com", "password": "s3cret"})
+    assert response.status_code == 200
+    upgraded = table.users["u1"]["password"]
+    assert upgraded.startswith("scrypt$")
+    assert passwords.verify_password("s3cret", upgraded)
+    response = client.post("/users/login", json={"email": "a@test.com", "password": "wrong"})
+    assert response.status_code == 401
+
+def test_login_caches_known_and_unknown_emails(monkeypatch):
+    import app as user_app
+    from email_cache import EmailCache
+    from passwords import hash_password
+
+    class CountingUsersTable(FakeUsersTable):
+        queries = 0
+
+        def query(self, **kwargs):
+            CountingUsersTable.queries += 1
+            return super().query(**kwargs)
+
+    stored = hash_password("s3cret", ("scrypt", 2 ** 10, 8, 1))
+    monkeypatch.setattr(user_app, "users_table", CountingUsersTable([{"user_id": "u1", "email": "a@test.com", "password": stored, "role": "student"}]))
+    monkeypatch.setattr(user_app, "email_cache", EmailCache())
+    monkeypatch.setattr(user_app, "needs_rehash", lambda stored: False)
+    for _ in range(3):
+        assert client.post("/users/login", json={"email": "a@test.com", "password": "s3cret"}).status_code == 200
+        assert client.post("/users/login", json={"email": "ghost@test.com", "password": "x"}).status_code == 401
+    assert CountingUsersTable.queries == 2
+    assert user_app.email_cache.stats()["negative_hits"] == 2
+
+def test_email_cache_registration_clears_negative_entry():
+    from email_cache import EmailCache
+    cache = EmailCache(negative_capacity=1000)
+    cache.remember_absent("new@test.com")
+    assert cache.is_known_absent("new@test.com")
+    cache.registered({"user_id": "u2", "email": "new@test.com"})
+    assert not cache.is_known_absent("new@test.com")
+    assert cache.get("new@test.com")["user_id"] == "u2"
+
+def test_email_cache_negatives_are_exact_and_bounded():
+    from email_cache import EmailCache
+    cache = EmailCache(negative_capacity=100, negative_ttl=60)
+    for i in range(10000):
+        cache.remember_absent(f"probe-{i}@test.com")
+    assert cache.stats()["absent_entries"] == 100
+    assert not any(cache.is_known_absent(f"user-{i}@test.com") for i in range(1000))
+    assert cache.is_known_absent("probe-9999@test.com")
+    assert not cache.is_known_absent("probe-0@test.com")
+    expiring = EmailCache(negative_ttl=0)
+    expiring.remember_absent("gone@test.com")
+    assert not expiring.is_known_absent("gone@test.com")
+
+def test_register_and_login_on_memory_engine(monkeypatch):
+    import app as user_app
+    import passwords
+    from email_cache import EmailCache
+    from storage import MemoryEngine
+    monkeypatch.setattr(passwords, "SCRYPT_N", 2 ** 10)
+    monkeypatch.setattr(user_app, "needs_rehash", lambda stored: False)
+    table = MemoryEngine().Table("learning-portal-users")
+    monkeypatch.setattr(user_app, "users_table", table)
+    monkeypatch.setattr(user_app, "email_cache", EmailCache())
+    user = {"name": "Ann", "email": "ann@test.com", "password": "s3cret"}
+
+    user_id = client.post("/users/register", json=user).json()["user_id"]
+    assert client.post("/users/register", json=user).status_code == 400
+    login = client.post("/users/login", json={"email": "ann@test.com", "password": "s3cret"})
+    assert login.json()["user_id"] == user_id
+    assert table.indexes["EmailIndex"] == {"ann@test.com": [user_id]}
+    assert not hasattr(table.records[user_id], "__dict__")
+
+def test_memory_token_store_refused_with_several_workers(monkeypatch):
+    import serving
+    import token_store
+    monkeypatch.setattr(serving, "WORKERS", 4)
+    monkeypatch.setenv("TOKEN_STORE", "memory")
+    with pytest.raises(RuntimeError, match="TOKEN_STORE=redis"):
+        token_store.create_token_store()
+    monkeypatch.setattr(serving, "ALLOW_PER_PROCESS_STATE", True)
+    assert token_store.create_token_store().stats()["backend"] == "memory"
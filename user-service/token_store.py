@@ -0,0 +1,105 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from serving import require_shared
+
+class MemoryTokenStore:
+    """Per-process token store bounded by size; oldest sessions go first."""
+
+    def __init__(self, max_tokens=100000, ttl=3600):
+        self.max_tokens = max_tokens
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def issue(self, token, session):
+        expires_at = time.time() + self.ttl
+        with self.lock:
+            self.sessions[token] = (expires_at, session)
+            while len(self.sessions) > self.max_tokens:
+                self.sessions.popitem(last=False)
+                self.evictions += 1
+        return expires_at
+
+    def get(self, token):
+        with self.lock:
+            entry = self.sessions.get(token)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self.sessions[token]
+                return None
+            return dict(entry[1], expires_at=entry[0])
+
+    def revoke(self, token):
+        with self.lock:
+            self.sessions.pop(token, None)
+
+    # Nothing here blocks, so async callers stay on the event loop
+    async def aissue(self, token, session):
+        return self.issue(token, session)
+
+    async def aget(self, token):
+        return self.get(token)
+
+    async def arevoke(self, token):
+        self.revoke(token)
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "tokens": len(self.sessions),
+            "max_tokens": self.max_tokens,
+            "ttl": self.ttl,
+            "evictions": self.evictions
+        }
+
+class RedisTokenStore:
+    """Token store shared by every worker and task through a Redis-compatible
+    server. redis-py is blocking, so async callers use the ``a*`` methods,
+    which run it in a thread."""
+
+    def __init__(self, url, ttl=3600, prefix="token"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def issue(self, token, session):
+        expires_at = time.time() + self.ttl
+        self.client.set(f"{self.prefix}:{token}", json.dumps(dict(session, expires_at=expires_at)), ex=self.ttl)
+        return expires_at
+
+    def get(self, token):
+        raw = self.client.get(f"{self.prefix}:{token}")
+        return json.loads(raw) if raw is not None else None
+
+    def revoke(self, token):
+        self.client.delete(f"{self.prefix}:{token}")
+
+    async def aissue(self, token, session):
+        return await asyncio.to_thread(self.issue, token, session)
+
+    async def aget(self, token):
+        return await asyncio.to_thread(self.get, token)
+
+    async def arevoke(self, token):
+        await asyncio.to_thread(self.revoke, token)
+
+    def stats(self):
+        return {"backend": "redis", "ttl": self.ttl}
+
+def create_token_store():
+    ttl = int(os.getenv("TOKEN_TTL", "3600"))
+    backend = os.getenv("TOKEN_STORE", "memory")
+    if backend == "redis":
+        return RedisTokenStore(os.getenv("TOKEN_STORE_REDIS_URL", "redis://localhost:6379/0"), ttl)
+    if backend != "memory":
+        raise ValueError(f"Unknown TOKEN_STORE: {backend}")
+    require_shared("TOKEN_STORE=memory", False, "a token issued by one worker would not validate on another; use TOKEN_STORE=redis")
+    return MemoryTokenStore(int(os.getenv("TOKEN_STORE_MAX_TOKENS", "100000")), ttl)
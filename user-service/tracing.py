@@ -0,0 +1,264 @@
+import atexit
+import contextvars
+import json
+import os
+import random
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "file")
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "/tmp/traces.ndjson")
+TRACE_FLUSH_SIZE = int(os.getenv("TRACE_FLUSH_SIZE", "256"))
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current = contextvars.ContextVar("trace_context", default=None)
+
+class SpanContext:
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id, span_id, sampled):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+def parse_traceparent(value):
+    match = TRACEPARENT.match(value or "")
+    if match is None or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return SpanContext(match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1)
+
+def current_traceparent():
+    context = _current.get()
+    return context.traceparent() if context is not None else None
+
+class Span:
+    __slots__ = ("name", "kind", "context", "parent_id", "attributes", "start_time", "started")
+
+    def __init__(self, name, kind, context, parent_id, attributes):
+        self.name = name
+        self.kind = kind
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_time = time.time()
+        self.started = time.perf_counter()
+
+class FileExporter:
+    """Appends finished spans to an NDJSON file in batches of ``flush_size``."""
+
+    def __init__(self, path, flush_size=256):
+        self.path = path
+        self.flush_size = flush_size
+        self.buffer = []
+        self.lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def export(self, record):
+        with self.lock:
+            self.buffer.append(record)
+            if len(self.buffer) < self.flush_size:
+                return
+            batch, self.buffer = self.buffer, []
+        self._write(batch)
+
+    def flush(self):
+        with self.lock:
+            batch, self.buffer = self.buffer, []
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch):
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps(record, default=str) + "\n" for record in batch))
+
+class MemoryExporter:
+    """Keeps finished spans in memory; a stand-in collector for local runs and tests."""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, record):
+        self.spans.append(record)
+
+    def flush(self):
+        pass
+
+class Tracer:
+    def __init__(self, service, exporter=None, sample_rate=0.0):
+        self.service = service
+        self.exporter = exporter
+        self.sample_rate = sample_rate if exporter is not None else 0.0
+        self.exported = 0
+
+    def sample(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start_span(self, name, kind="internal", attributes=None, parent=None):
+        if parent is None:
+            # Root span: this is where the sampling decision is made, and
+            # everything downstream follows it via the traceparent flags
+            context = SpanContext(secrets.token_hex(16), secrets.token_hex(8), self.sample())
+            return Span(name, kind, context, None, attributes or {})
+        context = SpanContext(parent.trace_id, secrets.token_hex(8), parent.sampled)
+        return Span(name, kind, context, parent.span_id, attributes or {})
+
+    def finish(self, span, error=None):
+        if not span.context.sampled or self.exporter is None:
+            return
+        self.exported += 1
+        self.exporter.export({
+            "trace_id": span.context.trace_id,
+            "span_id": span.context.span_id,
+            "parent_id": span.parent_id,
+            "service": self.service,
+            "name": span.name,
+            "kind": span.kind,
+            "start": span.start_time,
+            "duration_ms": round((time.perf_counter() - span.started) * 1000, 3),
+            "status": "error" if error else "ok",
+            "error": error,
+            "attributes": span.attributes
+        })
+
+    @contextmanager
+    def span(self, name, kind="internal", attributes=None, parent=None):
+        span = self.start_span(name, kind, attributes, parent or _current.get())
+        token = _current.set(span.context)
+        try:
+            yield span
+        except Exception as e:
+            self.finish(span, type(e).__name__)
+            raise
+        else:
+            self.finish(span)
+        finally:
+            _current.reset(token)
+
+    def stats(self):
+        return {"service": self.service, "sample_rate": self.sample_rate, "exported_spans": self.exported}
+
+def create_tracer(service):
+    if TRACE_EXPORTER == "memory":
+        exporter = MemoryExporter()
+    elif TRACE_EXPORTER == "file":
+        exporter = FileExporter(TRACE_EXPORT_PATH, TRACE_FLUSH_SIZE)
+    else:
+        exporter = None
+    return Tracer(service, exporter, TRACE_SAMPLE_RATE)
+
+class TracingMiddleware:
+    """Continues the caller's trace from ``traceparent`` or starts a new one.
+
+    With ``edge=True`` the caller is untrusted: its trace id is kept but the
+    sampling decision is made here, so no client can force every request
+    to be traced.
+    """
+
+    def __init__(self, app, tracer, edge=False):
+        self.app = app
+        self.tracer = tracer
+        self.edge = edge
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        parent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                parent = parse_traceparent(value.decode("latin-1"))
+                break
+        if parent is not None and self.edge:
+            parent = SpanContext(parent.trace_id, parent.span_id, self.tracer.sample())
+        span = self.tracer.start_span("http.request", "server", None, parent)
+        token = _current.set(span.context)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            if span.context.sampled:
+                route = scope.get("route")
+                span.name = f"{scope['method']} {route.path if route is not None else 'unmatched'}"
+                span.attributes["http.target"] = scope["path"]
+                span.attributes["http.status_code"] = status[0]
+                self.tracer.finish(span, "http_error" if status[0] >= 500 else None)
+
+def trace_dynamodb(resource, tracer):
+    events = resource.meta.client.meta.events
+
+    def before_call(model, params, context, **kwargs):
+        parent = _current.get()
+        if parent is not None and parent.sampled:
+            context["trace_span"] = tracer.start_span(
+                f"dynamodb.{model.name}", "client",
+                {"db.system": "dynamodb", "db.operation": model.name, "db.table": params.get("TableName")},
+                parent
+            )
+
+    def after_call(http_response, context, **kwargs):
+        span = context.pop("trace_span", None)
+        if span is not None:
+            span.attributes["http.status_code"] = http_response.status_code
+            tracer.finish(span, "client_error" if http_response.status_code >= 400 else None)
+
+    def after_call_error(exception, context, **kwargs):
+        span = context.pop("trace_span", None)
+        if span is not None:
+            tracer.finish(span, type(exception).__name__)
+
+    events.register("before-parameter-build.dynamodb", before_call)
+    events.register("after-call.dynamodb", after_call)
+    events.register("after-call-error.dynamodb", after_call_error)
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """Wraps an httpx transport to open a client span per call to ``peer``
+    and inject ``traceparent``. A call that raises finishes its span with
+    the exception's name, as ``trace_dynamodb`` does."""
+
+    def __init__(self, transport, peer, tracer):
+        self.transport = transport
+        self.peer = peer
+        self.tracer = tracer
+
+    async def handle_async_request(self, request):
+        parent = _current.get()
+        if parent is None:
+            return await self.transport.handle_async_request(request)
+        if not parent.sampled:
+            # Pass the "not sampled" decision on so downstream skips it too
+            request.headers["traceparent"] = parent.traceparent()
+            return await self.transport.handle_async_request(request)
+        span = self.tracer.start_span(
+            f"HTTP {request.method}", "client",
+            {"peer.service": self.peer, "http.url": str(request.url)},
+            parent
+        )
+        request.headers["traceparent"] = span.context.traceparent()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException as e:
+            self.tracer.finish(span, type(e).__name__)
+            raise
+        span.attributes["http.status_code"] = response.status_code
+        self.tracer.finish(span, "http_error" if response.status_code >= 500 else None)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()